@@ -5,9 +5,25 @@ Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
 """
 import sqlite3
 import hashlib
-import re
 from datetime import datetime
 import logging
+from payload_scanner import PayloadScanner
+from db_migrations import MigrationRunner
+
+try:
+    import numpy as np
+except ImportError:  # analyze_batch falls back to per-event scoring
+    np = None
+
+# Vectorized scoring: feature columns, their weights and the level buckets
+BATCH_FEATURES = ('bot_user_agent', 'sql_injection', 'honeypot', 'port_scan', 'no_user_agent')
+BATCH_WEIGHTS = (30, 50, 40, 60, 20)
+LEVEL_THRESHOLDS = (20, 40, 60, 80)
+THREAT_LEVELS = ('MINIMAL', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+
+# Largest table a batched migration may copy at startup (one batch); beyond
+# that MigrationPending asks the operator to run db_migrations.py instead
+INLINE_MIGRATION_ROWS = 5000
 
 class BotDetector:
     """Core bot detection and scoring engine"""
@@ -29,6 +45,7 @@ class BotDetector:
             "union.*select", "or.*1.*=.*1", "exec\\(", "drop.*table",
             "insert.*into", "update.*set", "delete.*from"
         ]
+        self.payload_scanner = PayloadScanner(self.sql_injection_patterns)
         
         self.honeypot_endpoints = [
             '/admin', '/phpmyadmin', '/wp-admin', '/.env', '/.git',
@@ -36,43 +53,18 @@ class BotDetector:
         ]
     
     def _init_database(self):
-        """Initialize SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS detected_bots (
-                bot_id TEXT PRIMARY KEY,
-                ip_address TEXT NOT NULL,
-                user_agent TEXT,
-                first_seen TEXT,
-                last_seen TEXT,
-                threat_level INTEGER,
-                bot_score INTEGER,
-                attack_count INTEGER DEFAULT 1,
-                detections TEXT
-            )
-        ''')
-        
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS attacks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                bot_id TEXT,
-                timestamp TEXT,
-                endpoint TEXT,
-                method TEXT,
-                payload TEXT,
-                FOREIGN KEY(bot_id) REFERENCES detected_bots(bot_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """Initialize SQLite database and bring its schema up to date"""
+        version = MigrationRunner(self.db_path, max_inline_rows=INLINE_MIGRATION_ROWS).run()
+        self.logger.debug(f"bots.db at schema v{version}")
     
-    def analyze_connection(self, ip, user_agent='', endpoint='', method='', payload=''):
+    def analyze_connection(self, ip, user_agent='', endpoint='', method='', payload='',
+                           count=1, first_seen=None, last_seen=None):
         """
         Analyze a connection and return threat assessment
-        
+
+        count/first_seen/last_seen describe a coalesced event standing for
+        `count` identical connections seen between the two timestamps.
+
         Returns dict with:
         - is_threat: bool
         - bot_score: int (0-100)
@@ -96,20 +88,18 @@ class BotDetector:
             detections.append('no_user_agent')
         
         # Check for SQL injection
-        if payload:
-            for pattern in self.sql_injection_patterns:
-                if re.search(pattern, payload.lower()):
-                    score += 50
-                    detections.append('sql_injection')
-                    break
+        inspection = self.payload_scanner.scan(payload)
+        if inspection['matched']:
+            score += 50
+            detections.append('sql_injection')
+        if inspection['truncated']:
+            detections.append(f"payload_truncated:{inspection['truncated_reason']}")
         
         # Check honeypot endpoints
-        if endpoint:
-            for trap in self.honeypot_endpoints:
-                if trap in endpoint:
-                    score += 40
-                    detections.append(f'honeypot:{trap}')
-                    break
+        trap = self.match_honeypot(endpoint)
+        if trap:
+            score += 40
+            detections.append(f'honeypot:{trap}')
         
         # Port scans (identified by user_agent pattern)
         if 'port_scan' in user_agent.lower() or 'syn_scan' in user_agent.lower():
@@ -134,7 +124,8 @@ class BotDetector:
         # Store in database if threat detected
         if score >= 20:
             self._record_bot(bot_id, ip, user_agent, score, threat_level, 
-                           detections, endpoint, method, payload)
+                           detections, endpoint, method, payload,
+                           count, first_seen, last_seen)
         
         return {
             'is_threat': score >= 30,  # Warn threshold
@@ -143,16 +134,134 @@ class BotDetector:
             'detections': detections,
             'bot_id': bot_id,
             'should_warn': score >= 30,
-            'should_attack': score >= 60
+            'should_attack': score >= 60,
+            'count': count
         }
     
+    def analyze_batch(self, events):
+        """
+        Score many events at once with vectorized array operations
+        
+        events is a list of dicts shaped like analyze_connection's keyword
+        arguments. Scores are identical to calling analyze_connection on each
+        event in order, but all database changes go out in one transaction.
+        
+        Returns dict of per-event arrays (bot_score, threat_level, is_threat,
+        should_warn, should_attack, count) plus detections and bot_id lists;
+        use batch_verdict() to get one event's analyze_connection-style dict.
+        """
+        if np is None:
+            results = [self.analyze_connection(**event) for event in events]
+            keys = ('is_threat', 'bot_score', 'threat_level', 'detections',
+                    'bot_id', 'should_warn', 'should_attack', 'count')
+            return {key: [r[key] for r in results] for key in keys}
+        
+        n = len(events)
+        user_agents = [event.get('user_agent') or '' for event in events]
+        endpoints = [event.get('endpoint') or '' for event in events]
+        payloads = [event.get('payload') or '' for event in events]
+        counts = np.array([event.get('count', 1) for event in events], dtype=np.int64)
+        
+        # Signature hits with plain substring checks (linear in each string);
+        # fixed-width numpy string arrays would be sized to the longest one
+        ua_lower = [ua.lower() for ua in user_agents]
+        ua_match = [
+            next((pattern for pattern in self.bot_user_agents if pattern in lowered), None)
+            if lowered else None
+            for lowered in ua_lower
+        ]
+        trap_match = [self.match_honeypot(endpoint) for endpoint in endpoints]
+        inspections = [self.payload_scanner.scan(payload) for payload in payloads]
+        
+        features = np.zeros((n, len(BATCH_FEATURES)), dtype=bool)
+        features[:, 0] = [match is not None for match in ua_match]
+        features[:, 1] = [inspection['matched'] for inspection in inspections]
+        features[:, 2] = [trap is not None for trap in trap_match]
+        features[:, 3] = ['port_scan' in lowered or 'syn_scan' in lowered
+                          for lowered in ua_lower]
+        features[:, 4] = [not ua for ua in user_agents]
+        
+        scores = features.astype(np.int64) @ np.array(BATCH_WEIGHTS, dtype=np.int64)
+        levels = np.array(THREAT_LEVELS)[
+            np.searchsorted(LEVEL_THRESHOLDS, scores, side='right')
+        ]
+        
+        # Same detection order as the scalar path
+        detections = []
+        for i in range(n):
+            found = []
+            if features[i, 0]:
+                found.append(f'bot_user_agent:{ua_match[i]}')
+            if features[i, 4]:
+                found.append('no_user_agent')
+            if features[i, 1]:
+                found.append('sql_injection')
+            if inspections[i]['truncated']:
+                found.append(f"payload_truncated:{inspections[i]['truncated_reason']}")
+            if features[i, 2]:
+                found.append(f'honeypot:{trap_match[i]}')
+            if features[i, 3]:
+                found.append('port_scan')
+            detections.append(found)
+        
+        bot_ids = [
+            hashlib.md5(f"{event['ip']}:{ua}".encode()).hexdigest()[:16]
+            for event, ua in zip(events, user_agents)
+        ]
+        
+        recorded = np.flatnonzero(scores >= 20)
+        if len(recorded):
+            self._record_bots_bulk([
+                (bot_ids[i], events[i]['ip'], user_agents[i], int(scores[i]),
+                 detections[i], endpoints[i], events[i].get('method', ''),
+                 payloads[i], int(counts[i]), events[i].get('first_seen'),
+                 events[i].get('last_seen'))
+                for i in recorded
+            ])
+        
+        return {
+            'is_threat': scores >= 30,  # Warn threshold
+            'bot_score': scores,
+            'threat_level': levels,
+            'detections': detections,
+            'bot_id': bot_ids,
+            'should_warn': scores >= 30,
+            'should_attack': scores >= 60,
+            'count': counts
+        }
+    
+    @staticmethod
+    def batch_verdict(verdicts, i):
+        """Return event i of an analyze_batch result as an analyze_connection dict"""
+        return {
+            'is_threat': bool(verdicts['is_threat'][i]),
+            'bot_score': int(verdicts['bot_score'][i]),
+            'threat_level': str(verdicts['threat_level'][i]),
+            'detections': verdicts['detections'][i],
+            'bot_id': verdicts['bot_id'][i],
+            'should_warn': bool(verdicts['should_warn'][i]),
+            'should_attack': bool(verdicts['should_attack'][i]),
+            'count': int(verdicts['count'][i])
+        }
+    
+    def match_honeypot(self, endpoint):
+        """Return the honeypot trap hit by endpoint, or None"""
+        if endpoint:
+            for trap in self.honeypot_endpoints:
+                if trap in endpoint:
+                    return trap
+        return None
+    
     def _record_bot(self, bot_id, ip, user_agent, score, threat_level, 
-                   detections, endpoint, method, payload):
+                   detections, endpoint, method, payload,
+                   count=1, first_seen=None, last_seen=None):
         """Record bot detection in database"""
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
-        
+
         now = datetime.now().isoformat()
+        first_seen = first_seen or now
+        last_seen = last_seen or first_seen
         detections_str = ','.join(detections)
         
         # Check if bot already exists
@@ -161,56 +270,134 @@ class BotDetector:
         
         if row:
             # Update existing
-            attack_count = row[0] + 1
+            attack_count = row[0] + count
             c.execute('''
-                UPDATE detected_bots 
+                UPDATE detected_bots
                 SET last_seen = ?, attack_count = ?, threat_level = ?, bot_score = ?
                 WHERE bot_id = ?
-            ''', (now, attack_count, score, score, bot_id))
+            ''', (last_seen, attack_count, score, score, bot_id))
         else:
             # Insert new
             c.execute('''
                 INSERT INTO detected_bots 
                 (bot_id, ip_address, user_agent, first_seen, last_seen, 
                  threat_level, bot_score, attack_count, detections)
-                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
-            ''', (bot_id, ip, user_agent, now, now, score, score, detections_str))
-        
-        # Record attack
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (bot_id, ip, user_agent, first_seen, last_seen, score, score,
+                  count, detections_str))
+
+        # Record attack (one row per coalesced event, with its multiplicity)
         c.execute('''
-            INSERT INTO attacks (bot_id, timestamp, endpoint, method, payload)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (bot_id, now, endpoint, method, payload[:500]))
+            INSERT INTO attacks (bot_id, timestamp, endpoint, method, payload,
+                                 count, last_timestamp, detections, bot_score)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (bot_id, first_seen, endpoint, method, payload[:500],
+              count, last_seen, detections_str, score))
+        
+        conn.commit()
+        conn.close()
+    
+    def _record_bots_bulk(self, records):
+        """
+        Record many detections in one transaction
+        
+        records are (bot_id, ip, user_agent, score, detections, endpoint,
+        method, payload, count, first_seen, last_seen) tuples in event order.
+        The result matches calling _record_bot on each record in turn.
+        """
+        now = datetime.now().isoformat()
+        bots = {}
+        attacks = []
+        
+        for (bot_id, ip, user_agent, score, detections, endpoint, method,
+             payload, count, first_seen, last_seen) in records:
+            first_seen = first_seen or now
+            last_seen = last_seen or first_seen
+            
+            bot = bots.get(bot_id)
+            if bot:
+                # Later sightings only move last_seen, count and score
+                bot['last_seen'] = last_seen
+                bot['attack_count'] += count
+                bot['score'] = score
+            else:
+                bots[bot_id] = {
+                    'ip': ip,
+                    'user_agent': user_agent,
+                    'first_seen': first_seen,
+                    'last_seen': last_seen,
+                    'score': score,
+                    'attack_count': count,
+                    'detections': ','.join(detections)
+                }
+            
+            attacks.append((bot_id, first_seen, endpoint, method, payload[:500],
+                            count, last_seen, ','.join(detections), score))
+        
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        
+        c.executemany('''
+            INSERT INTO detected_bots
+            (bot_id, ip_address, user_agent, first_seen, last_seen,
+             threat_level, bot_score, attack_count, detections)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(bot_id) DO UPDATE SET
+                last_seen = excluded.last_seen,
+                attack_count = attack_count + excluded.attack_count,
+                threat_level = excluded.threat_level,
+                bot_score = excluded.bot_score
+        ''', [
+            (bot_id, b['ip'], b['user_agent'], b['first_seen'], b['last_seen'],
+             b['score'], b['score'], b['attack_count'], b['detections'])
+            for bot_id, b in bots.items()
+        ])
+        
+        c.executemany('''
+            INSERT INTO attacks (bot_id, timestamp, endpoint, method, payload,
+                                 count, last_timestamp, detections, bot_score)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', attacks)
         
         conn.commit()
         conn.close()
     
     def get_bot_info(self, bot_id):
         """Get information about a specific bot"""
+        return self.get_bots_info([bot_id]).get(bot_id)
+    
+    def get_bots_info(self, bot_ids):
+        """Get information about several bots in one query, keyed by bot_id"""
+        bot_ids = list(dict.fromkeys(bot_ids))
+        bots = {}
+        if not bot_ids:
+            return bots
+        
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
         
-        c.execute('''
-            SELECT ip_address, user_agent, first_seen, last_seen, 
-                   threat_level, bot_score, attack_count, detections
-            FROM detected_bots WHERE bot_id = ?
-        ''', (bot_id,))
+        # Stay under SQLite's host parameter limit
+        for start in range(0, len(bot_ids), 500):
+            chunk = bot_ids[start:start + 500]
+            c.execute(f'''
+                SELECT bot_id, ip_address, user_agent, first_seen, last_seen,
+                       threat_level, bot_score, attack_count, detections
+                FROM detected_bots WHERE bot_id IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            for row in c.fetchall():
+                bots[row[0]] = {
+                    'ip': row[1],
+                    'user_agent': row[2],
+                    'first_seen': row[3],
+                    'last_seen': row[4],
+                    'threat_level': row[5],
+                    'bot_score': row[6],
+                    'attack_count': row[7],
+                    'detections': row[8]
+                }
         
-        row = c.fetchone()
         conn.close()
-        
-        if row:
-            return {
-                'ip': row[0],
-                'user_agent': row[1],
-                'first_seen': row[2],
-                'last_seen': row[3],
-                'threat_level': row[4],
-                'bot_score': row[5],
-                'attack_count': row[6],
-                'detections': row[7]
-            }
-        return None
+        return bots
     
     def get_statistics(self):
         """Get overall statistics"""
@@ -223,7 +410,7 @@ class BotDetector:
         c.execute('SELECT COUNT(*) FROM detected_bots WHERE threat_level >= 60')
         high_threats = c.fetchone()[0]
         
-        c.execute('SELECT COUNT(*) FROM attacks')
+        c.execute('SELECT COALESCE(SUM(count), 0) FROM attacks')
         total_attacks = c.fetchone()[0]
         
         conn.close()
@@ -10,6 +10,7 @@ Source0:        %{name}-%{version}.tar.gz
 BuildArch:      noarch
 Requires:       python3
 Requires:       python3-libs
+Requires:       python3-numpy
 Requires:       systemd
 Requires:       tempest-sql
 
@@ -53,6 +54,14 @@ install -m 0755 bot_detector.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
 install -m 0755 network_monitor.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
 install -m 0755 defense_actions.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
 install -m 0755 ctt_bot_defender.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 event_coalescer.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 ingest_queue.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 history_export.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 payload_scanner.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 threat_logging.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 detection_aggregator.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 ingest_server.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
+install -m 0755 db_migrations.py $RPM_BUILD_ROOT%{_datadir}/ctt-bot-defender/
 
 # Install systemd service
 install -m 0644 ctt-bot-defender.service $RPM_BUILD_ROOT%{_unitdir}/
@@ -62,6 +71,14 @@ install -m 0644 ctt-bot-defender.service $RPM_BUILD_ROOT%{_unitdir}/
 %{_datadir}/ctt-bot-defender/network_monitor.py
 %{_datadir}/ctt-bot-defender/defense_actions.py
 %{_datadir}/ctt-bot-defender/ctt_bot_defender.py
+%{_datadir}/ctt-bot-defender/event_coalescer.py
+%{_datadir}/ctt-bot-defender/ingest_queue.py
+%{_datadir}/ctt-bot-defender/history_export.py
+%{_datadir}/ctt-bot-defender/payload_scanner.py
+%{_datadir}/ctt-bot-defender/threat_logging.py
+%{_datadir}/ctt-bot-defender/detection_aggregator.py
+%{_datadir}/ctt-bot-defender/ingest_server.py
+%{_datadir}/ctt-bot-defender/db_migrations.py
 %{_unitdir}/ctt-bot-defender.service
 %dir /var/lib/ctt-bot-defender
 %dir /var/log/ctt-bot-defender
@@ -93,6 +110,8 @@ echo "  Logs:    journalctl -u ctt-bot-defender.service -f"
 echo "  Stop:    systemctl stop ctt-bot-defender.service"
 echo ""
 echo "Database:  /var/lib/ctt-bot-defender/bots.db"
+echo "Upgrading: python3 %{_datadir}/ctt-bot-defender/db_migrations.py --status"
+echo "           (large schema upgrades run there, then restart the service)"
 echo "Warnings:  /var/lib/ctt-bot-defender/warnings/"
 echo "Attacks:   /var/lib/ctt-bot-defender/attacks/"
 echo ""
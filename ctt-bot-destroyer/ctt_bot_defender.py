@@ -5,27 +5,51 @@ Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
 """
 import time
 import logging
+import socket
 import sys
 import argparse
 from bot_detector import BotDetector
 from network_monitor import NetworkMonitor
 from defense_actions import DefenseActions
+from event_coalescer import EventCoalescer
+from ingest_queue import IngestQueue
+from threat_logging import setup_async_logging
+from detection_aggregator import AggregatorClient
+from ingest_server import IngestServer
+from db_migrations import MigrationPending
+
+# sysexits EX_CONFIG; the unit sets RestartPreventExitStatus for it
+EXIT_MIGRATION_PENDING = 78
 
 class CTTBotDefender:
     """Main bot defender service"""
     
-    def __init__(self, scan_interval=10):
+    def __init__(self, scan_interval=10, queue_size=10000, sample_rate=0.1,
+                 batch_size=1000, log_mode='sync', log_window=60,
+                 aggregator=None, node_id=None, ingest_socket=None,
+                 ingest_group=None, ingest_mode=0o660):
         self.scan_interval = scan_interval
+        self.batch_size = batch_size
         self.running = False
         
         # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        self.log_listener = None
+        self.log_limiter = None
+        self.log_handler = None
+        if log_mode == 'async':
+            # JSON records via a background writer, repeats per (ip, rule) rate-limited
+            self.log_listener, self.log_limiter, self.log_handler = setup_async_logging(
+                level=logging.INFO,
+                window=log_window
+            )
+        else:
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                handlers=[
+                    logging.StreamHandler(sys.stdout)
+                ]
+            )
         self.logger = logging.getLogger('CTTBotDefender')
         
         # Initialize components
@@ -33,6 +57,26 @@ class CTTBotDefender:
         self.detector = BotDetector()
         self.monitor = NetworkMonitor()
         self.defense = DefenseActions()
+        self.coalescer = EventCoalescer()
+        self.queue = IngestQueue(
+            maxsize=queue_size,
+            sample_rate=sample_rate,
+            is_priority=self._is_priority
+        )
+        
+        # Fleet aggregation (optional)
+        self.aggregator = None
+        if aggregator:
+            self.aggregator = AggregatorClient(aggregator, node_id or socket.gethostname())
+            self.aggregator.start()
+            self.logger.info(f"🌐 Streaming detections to aggregator at {aggregator}")
+        
+        # Push ingest from web servers / log shippers (optional)
+        self.ingest = None
+        if ingest_socket:
+            self.ingest = IngestServer(ingest_socket, sink=self.queue.put,
+                                       socket_group=ingest_group, socket_mode=ingest_mode)
+        self._last_shed = 0
         
         self.logger.info("✅ All systems operational")
     
@@ -41,49 +85,34 @@ class CTTBotDefender:
         self.running = True
         self.logger.info("🛡️  CTT BOT DEFENDER STARTED - Active Defense Mode")
         self.logger.info(f"   Scan interval: {self.scan_interval} seconds")
+        if self.ingest:
+            self.ingest.start()
         
-        report_counter = 0
+        last_report = time.monotonic()
         
         try:
             while self.running:
-                # Monitor active connections
-                connections = self.monitor.get_active_connections()
+                cycle_start = time.monotonic()
                 
-                for conn in connections:
-                    self._analyze_and_respond(
-                        ip=conn['ip'],
-                        user_agent=f"tcp_connection:{conn['state']}",
-                        endpoint='',
-                        method='TCP'
-                    )
+                # Collect this cycle's events, collapse duplicates and enqueue
+                self._collect_events()
+                for event in self.coalescer.drain():
+                    self.queue.put(event)
                 
-                # Monitor HTTP logs (if available)
-                http_requests = self.monitor.monitor_http_access()
-                for req in http_requests:
-                    self._analyze_and_respond(
-                        ip=req['ip'],
-                        user_agent=req['user_agent'],
-                        endpoint=req['endpoint'],
-                        method=req['method']
-                    )
+                # Work the queue until the next poll is due; pushed events wake the wait
+                deadline = cycle_start + self.scan_interval
+                while time.monotonic() < deadline:
+                    if self.queue.wait(deadline - time.monotonic()):
+                        self._process_batch(self.queue.get_batch(self.batch_size))
                 
-                # Monitor port scans
-                scans = self.monitor.monitor_port_scans()
-                for scan in scans:
-                    self._analyze_and_respond(
-                        ip=scan['ip'],
-                        user_agent=f"port_scan:{scan['port']}",
-                        endpoint=f"/port:{scan['port']}",
-                        method='SCAN'
-                    )
+                self._check_degradation()
+                if self.log_limiter:
+                    self.log_limiter.flush()
                 
-                # Generate report every 5 minutes
-                report_counter += self.scan_interval
-                if report_counter >= 300:
+                # Generate report every 5 minutes (by the clock: cycles vary in length)
+                if time.monotonic() - last_report >= 300:
                     self._generate_report()
-                    report_counter = 0
-                
-                time.sleep(self.scan_interval)
+                    last_report = time.monotonic()
         
         except KeyboardInterrupt:
             self.logger.info("🛑 Shutdown requested")
@@ -92,18 +121,70 @@ class CTTBotDefender:
         finally:
             self.stop()
     
-    def _analyze_and_respond(self, ip, user_agent='', endpoint='', method='', payload=''):
-        """Analyze connection and take appropriate action"""
+    def _collect_events(self):
+        """Feed this cycle's connections, HTTP requests and scans to the coalescer"""
+        # Monitor active connections
+        for conn in self.monitor.get_active_connections():
+            self.coalescer.add({
+                'ip': conn['ip'],
+                'user_agent': f"tcp_connection:{conn['state']}",
+                'endpoint': '',
+                'method': 'TCP'
+            })
+        
+        # Monitor HTTP logs (if available)
+        for req in self.monitor.monitor_http_access():
+            self.coalescer.add({
+                'ip': req['ip'],
+                'user_agent': req['user_agent'],
+                'endpoint': req['endpoint'],
+                'method': req['method']
+            })
+        
+        # Monitor port scans
+        for scan in self.monitor.monitor_port_scans():
+            self.coalescer.add({
+                'ip': scan['ip'],
+                'user_agent': f"port_scan:{scan['port']}",
+                'endpoint': f"/port:{scan['port']}",
+                'method': 'SCAN'
+            })
+    
+    def _process_batch(self, events):
+        """Score a batch of events in one pass and respond to the threats"""
         try:
-            # Analyze the connection
-            analysis = self.detector.analyze_connection(
-                ip=ip,
-                user_agent=user_agent,
-                endpoint=endpoint,
-                method=method,
-                payload=payload
+            verdicts = self.detector.analyze_batch(events)
+        except Exception as e:
+            self.logger.error(f"Error analyzing batch of {len(events)} events: {e}")
+            return
+        
+        # One lookup for every bot this batch will act on
+        try:
+            bots = self.detector.get_bots_info(
+                verdicts['bot_id'][i] for i in range(len(events)) if verdicts['is_threat'][i]
             )
-            
+        except Exception as e:
+            self.logger.error(f"Error loading bot info: {e}")
+            bots = {}
+        
+        for i, event in enumerate(events):
+            analysis = BotDetector.batch_verdict(verdicts, i)
+            self._respond(event, analysis, bots.get(analysis['bot_id']))
+    
+    def _respond(self, event, analysis, bot_info=None):
+        """Take appropriate action for one analyzed event"""
+        ip = event['ip']
+        user_agent = event.get('user_agent', '')
+        count = analysis['count']
+        log_fields = {
+            'ip': ip,
+            'rule': ','.join(analysis['detections']),
+            'bot_id': analysis['bot_id'],
+            'score': analysis['bot_score'],
+            'level': analysis['threat_level'],
+            'count': count
+        }
+        try:
             # If threat detected, log it
             if analysis['is_threat']:
                 self.logger.warning(
@@ -111,10 +192,16 @@ class CTTBotDefender:
                     f"Score: {analysis['bot_score']} - "
                     f"Level: {analysis['threat_level']} - "
                     f"Detections: {', '.join(analysis['detections'])}"
+                    + (f" - x{count}" if count > 1 else ""),
+                    extra=log_fields
                 )
                 
-                # Get full bot info
-                bot_info = self.detector.get_bot_info(analysis['bot_id'])
+                # Share with the fleet
+                if self.aggregator:
+                    self.aggregator.record(ip, analysis['bot_score'], count,
+                                           analysis['detections'])
+                
+                # Fall back to the verdict if the bot row was not loaded
                 if not bot_info:
                     bot_info = {
                         'ip': ip,
@@ -135,15 +222,37 @@ class CTTBotDefender:
                     if result['success']:
                         self.logger.critical(
                             f"💥 COUNTER-ATTACK SUCCESSFUL: {ip} - "
-                            f"Method: {result.get('method')}"
+                            f"Method: {result.get('method')}",
+                            extra=dict(log_fields, rule='counter_attack')
                         )
                     else:
                         self.logger.warning(
-                            f"⚠️  Counter-attack logged for manual execution: {ip}"
+                            f"⚠️  Counter-attack logged for manual execution: {ip}",
+                            extra=dict(log_fields, rule='counter_attack')
                         )
         
         except Exception as e:
-            self.logger.error(f"Error analyzing {ip}: {e}")
+            self.logger.error(f"Error responding to {ip}: {e}")
+    
+    def _is_priority(self, event):
+        """Honeypot hits and IPs flagged by other fleet nodes skip load shedding"""
+        if self.detector.match_honeypot(event['endpoint']) is not None:
+            return True
+        return bool(self.aggregator and self.aggregator.fleet_nodes(event['ip']))
+    
+    def _check_degradation(self):
+        """Warn when the ingest queue is shedding events or lagging behind"""
+        stats = self.queue.get_statistics()
+        shed = stats['shed_total'] - self._last_shed
+        self._last_shed = stats['shed_total']
+        
+        if shed or stats['oldest_age'] > self.scan_interval:
+            self.logger.warning(
+                f"⚠️  INGEST DEGRADED: shed {shed} events this cycle "
+                f"({stats['shed_priority']} priority / {stats['shed_repeat']} repeat total) - "
+                f"Backlog: {stats['queued']} - "
+                f"Lag: {stats['oldest_age']:.1f}s (max {stats['max_lag']:.1f}s)"
+            )
     
     def _generate_report(self):
         """Generate and log statistics report"""
@@ -154,6 +263,36 @@ class CTTBotDefender:
                 f"{stats['high_threats']} HIGH/CRITICAL, "
                 f"{stats['total_attacks']} total attacks"
             )
+            
+            queue_stats = self.queue.get_statistics()
+            self.logger.info(
+                f"📥 INGEST: {queue_stats['accepted']} accepted, "
+                f"{queue_stats['shed_total']} shed, "
+                f"{queue_stats['queued']} queued, "
+                f"max lag {queue_stats['max_lag']:.1f}s"
+            )
+            
+            if self.log_handler:
+                self.logger.info(
+                    f"📝 LOGGING: {self.log_handler.dropped} records dropped, "
+                    f"{self.log_limiter.total_suppressed} suppressed, "
+                    f"{self.log_limiter.evicted} rate-limit keys evicted"
+                )
+            
+            if self.ingest:
+                self.logger.info(
+                    f"📥 PUSH INGEST: {self.ingest.received} events received, "
+                    f"{self.ingest.forwarded} after coalescing, "
+                    f"{self.ingest.rejected} rejected"
+                )
+            
+            if self.aggregator:
+                fleet = self.aggregator.fleet_statistics()
+                self.logger.info(
+                    f"🌐 FLEET: {fleet['known']} IPs known, "
+                    f"{fleet['shared']} reported by other nodes, "
+                    f"{self.aggregator.sent} sent, {self.aggregator.dropped} dropped"
+                )
         except Exception as e:
             self.logger.error(f"Error generating report: {e}")
     
@@ -161,6 +300,14 @@ class CTTBotDefender:
         """Stop the defense service"""
         self.running = False
         self.logger.info("🛑 CTT BOT DEFENDER STOPPED")
+        
+        if self.ingest:
+            self.ingest.stop()
+        if self.aggregator:
+            self.aggregator.stop()
+        if self.log_listener:
+            self.log_limiter.flush(force=True)
+            self.log_listener.stop()
 
 
 def main():
@@ -175,6 +322,63 @@ def main():
         help='Scan interval in seconds (default: 10)'
     )
     
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=10000,
+        help='Maximum events buffered between sources and detector (default: 10000)'
+    )
+    parser.add_argument(
+        '--sample-rate',
+        type=float,
+        default=0.1,
+        help='Fraction of repeat events admitted when the queue is full (default: 0.1)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=1000,
+        help='Events scored per vectorized detector batch (default: 1000)'
+    )
+    parser.add_argument(
+        '--log-mode',
+        choices=['sync', 'async'],
+        default='sync',
+        help='sync: plain text to stdout; async: queued JSON with per-IP rate limiting (default: sync)'
+    )
+    parser.add_argument(
+        '--log-window',
+        type=int,
+        default=60,
+        help='Seconds between repeated log lines for the same IP and rule in async mode (default: 60)'
+    )
+    parser.add_argument(
+        '--aggregator',
+        default=None,
+        help='Fleet aggregator address, host:port or unix socket path (default: disabled)'
+    )
+    parser.add_argument(
+        '--node-id',
+        default=None,
+        help='Name reported to the aggregator (default: hostname)'
+    )
+    parser.add_argument(
+        '--ingest-socket',
+        default=None,
+        help='Accept pushed request events on this unix socket path or host:port (default: disabled)'
+    )
+    parser.add_argument(
+        '--ingest-group',
+        default=None,
+        help='Group owning the ingest unix socket, e.g. nginx (default: unchanged)'
+    )
+    parser.add_argument(
+        '--ingest-mode',
+        type=lambda value: int(value, 8),
+        default=0o660,
+        help='Ingest unix socket permissions in octal (default: 660)'
+    )
+    
     args = parser.parse_args()
     
     print("="*70)
@@ -184,7 +388,23 @@ def main():
     print("="*70)
     print()
     
-    defender = CTTBotDefender(scan_interval=args.interval)
+    try:
+        defender = CTTBotDefender(
+            scan_interval=args.interval,
+            queue_size=args.queue_size,
+            sample_rate=args.sample_rate,
+            batch_size=args.batch_size,
+            log_mode=args.log_mode,
+            log_window=args.log_window,
+            aggregator=args.aggregator,
+            node_id=args.node_id,
+            ingest_socket=args.ingest_socket,
+            ingest_group=args.ingest_group,
+            ingest_mode=args.ingest_mode
+        )
+    except MigrationPending as e:
+        print(f"❌ {e}", flush=True)
+        sys.exit(EXIT_MIGRATION_PENDING)
     defender.start()
 
 
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+CTT Database Migrations - Schema-Versioned, Resumable Upgrades for bots.db
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import sqlite3
+import sys
+import argparse
+import logging
+
+class MigrationPending(Exception):
+    """A batched migration is too large to run inline; run db_migrations.py instead"""
+
+
+class _Superseded(Exception):
+    """Another runner applied the migration while this one was working on it"""
+
+
+# Per-migration resume points for batched data migrations
+PROGRESS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_migration_progress (
+        version INTEGER PRIMARY KEY,
+        last_key INTEGER NOT NULL
+    )
+'''
+
+
+def _baseline(runner, conn):
+    """Tables as created before versioning, plus the attack multiplicity columns"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS detected_bots (
+            bot_id TEXT PRIMARY KEY,
+            ip_address TEXT NOT NULL,
+            user_agent TEXT,
+            first_seen TEXT,
+            last_seen TEXT,
+            threat_level INTEGER,
+            bot_score INTEGER,
+            attack_count INTEGER DEFAULT 1,
+            detections TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attacks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bot_id TEXT,
+            timestamp TEXT,
+            endpoint TEXT,
+            method TEXT,
+            payload TEXT,
+            count INTEGER DEFAULT 1,
+            last_timestamp TEXT,
+            FOREIGN KEY(bot_id) REFERENCES detected_bots(bot_id)
+        )
+    ''')
+
+    # Databases created before event coalescing lack the multiplicity columns
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(attacks)')]
+    if 'count' not in columns:
+        conn.execute('ALTER TABLE attacks ADD COLUMN count INTEGER DEFAULT 1')
+    if 'last_timestamp' not in columns:
+        conn.execute('ALTER TABLE attacks ADD COLUMN last_timestamp TEXT')
+
+
+def _indexes(runner, conn):
+    """Indexes for per-bot attack lookups, time-range scans and score filters"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attacks_bot_id ON attacks(bot_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attacks_timestamp ON attacks(timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bots_ip ON detected_bots(ip_address)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bots_score ON detected_bots(bot_score)')
+
+
+def _bots_without_rowid(runner, conn):
+    """
+    Rebuild detected_bots as a WITHOUT ROWID table clustered on bot_id
+
+    Every detection looks bots up by bot_id; clustering on it removes the
+    extra rowid b-tree hop. Rows are copied in batches while triggers
+    mirror concurrent writes, then the tables are swapped in one step.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS detected_bots_v3 (
+            bot_id TEXT PRIMARY KEY,
+            ip_address TEXT NOT NULL,
+            user_agent TEXT,
+            first_seen TEXT,
+            last_seen TEXT,
+            threat_level INTEGER,
+            bot_score INTEGER,
+            attack_count INTEGER DEFAULT 1,
+            detections TEXT
+        ) WITHOUT ROWID
+    ''')
+    columns = ('bot_id, ip_address, user_agent, first_seen, last_seen, '
+               'threat_level, bot_score, attack_count, detections')
+    new_columns = ', '.join(f'NEW.{c.strip()}' for c in columns.split(','))
+    for event in ('INSERT', 'UPDATE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS detected_bots_v3_{event.lower()}
+            AFTER {event} ON detected_bots BEGIN
+                INSERT OR REPLACE INTO detected_bots_v3 ({columns}) VALUES ({new_columns});
+            END
+        ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS detected_bots_v3_delete
+        AFTER DELETE ON detected_bots BEGIN
+            DELETE FROM detected_bots_v3 WHERE bot_id = OLD.bot_id;
+        END
+    ''')
+
+    # Rows written by the triggers are newer than the batch copy: keep them
+    runner.batched(conn, 3, 'detected_bots', f'''
+        INSERT OR IGNORE INTO detected_bots_v3 ({columns})
+        SELECT {columns} FROM detected_bots WHERE rowid > ? AND rowid <= ?
+    ''')
+
+    conn.execute('DROP TRIGGER detected_bots_v3_insert')
+    conn.execute('DROP TRIGGER detected_bots_v3_update')
+    conn.execute('DROP TRIGGER detected_bots_v3_delete')
+    conn.execute('DROP TABLE detected_bots')
+    conn.execute('ALTER TABLE detected_bots_v3 RENAME TO detected_bots')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bots_ip ON detected_bots(ip_address)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bots_score ON detected_bots(bot_score)')
+
+
+def _attack_verdicts(runner, conn):
+    """
+    Store each attack's own detections and score
+
+    detected_bots keeps a bot's first detections and latest score, which
+    misattributes later attacks in history reports. Older rows stay NULL
+    and readers fall back to the bot's values for them.
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(attacks)')]
+    if 'detections' not in columns:
+        conn.execute('ALTER TABLE attacks ADD COLUMN detections TEXT')
+    if 'bot_score' not in columns:
+        conn.execute('ALTER TABLE attacks ADD COLUMN bot_score INTEGER')
+
+
+# (version, description, function); append new migrations, never reorder
+MIGRATIONS = [
+    (1, 'baseline schema', _baseline),
+    (2, 'attack and bot indexes', _indexes),
+    (3, 'detected_bots as WITHOUT ROWID', _bots_without_rowid),
+    (4, 'per-attack detections and score', _attack_verdicts),
+]
+
+
+class MigrationRunner:
+    """
+    Upgrade bots.db to the latest schema version (PRAGMA user_version)
+
+    Each migration's final step commits together with the version bump.
+    Large data copies go through batched(): every batch is its own short
+    transaction and records a resume point, so the defender can keep
+    writing in between and an interrupted upgrade continues where it left
+    off when run again.
+
+    Every transaction re-reads user_version after taking the write lock,
+    so when two runners race (e.g. the CLI and a restarting defender) the
+    one that finds its migration already applied stops and moves on.
+    With max_inline_rows set, a batched migration over a larger table
+    raises MigrationPending before changing anything.
+    """
+
+    def __init__(self, db_path, batch_size=5000, progress=None, max_inline_rows=None):
+        self.logger = logging.getLogger('MigrationRunner')
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.progress = progress    # callable(version, done, total)
+        self.max_inline_rows = max_inline_rows
+
+    def _connect(self):
+        # Explicit transactions; WAL lets readers and the defender run alongside
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def current_version(self, conn=None):
+        """Schema version of the database (0 = never migrated)"""
+        own = conn is None
+        conn = conn or self._connect()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if own:
+            conn.close()
+        return version
+
+    def pending(self):
+        """Migrations not yet applied"""
+        version = self.current_version()
+        return [m for m in MIGRATIONS if m[0] > version]
+
+    def run(self):
+        """Apply all pending migrations; returns the final version"""
+        conn = self._connect()
+        try:
+            conn.execute(PROGRESS_TABLE)
+            version = self.current_version(conn)
+            for target, description, migrate in MIGRATIONS:
+                if target <= version:
+                    continue
+                try:
+                    self._begin(conn, target)
+                    self.logger.info(f"🗄️  Migrating bots.db to v{target}: {description}")
+                    migrate(self, conn)
+                    conn.execute('DELETE FROM schema_migration_progress WHERE version = ?',
+                                 (target,))
+                    conn.execute(f'PRAGMA user_version = {int(target)}')
+                    conn.execute('COMMIT')
+                except _Superseded:
+                    version = self.current_version(conn)
+                    self.logger.info(f"   v{target} was applied by another runner")
+                    continue
+                except BaseException:
+                    # Batches already committed stay; their resume point is recorded
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    raise
+                version = target
+            return version
+        finally:
+            conn.close()
+
+    def _begin(self, conn, version):
+        """Open a write transaction for migration version, unless it is already applied"""
+        conn.execute('BEGIN IMMEDIATE')
+        if self.current_version(conn) >= version:
+            conn.execute('ROLLBACK')
+            raise _Superseded(version)
+
+    def batched(self, conn, version, table, sql):
+        """
+        Run sql (with '? < rowid <= ?' placeholders) over table in rowid batches
+
+        Called inside a migration's open transaction; that transaction is
+        committed first so each batch commits on its own with its resume
+        point, and a new one is opened for the migration's final step.
+        """
+        if self.max_inline_rows is not None:
+            rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            if rows > self.max_inline_rows:
+                # Still inside the migration's first transaction: run() rolls it back
+                raise MigrationPending(
+                    f"bots.db needs schema v{version}, which copies {rows} {table} rows; "
+                    f"run db_migrations.py --db {self.db_path} (the running defender "
+                    f"can keep going meanwhile), then start the new version"
+                )
+        conn.execute('COMMIT')
+
+        row = conn.execute('SELECT last_key FROM schema_migration_progress WHERE version = ?',
+                           (version,)).fetchone()
+        start = row[0] if row else 0
+        end = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+        total = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        done = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE rowid <= ?',
+                            (start,)).fetchone()[0]
+        if start:
+            self.logger.info(f"   Resuming v{version} after rowid {start}")
+
+        while start < end:
+            stop = min(start + self.batch_size, end)
+            self._begin(conn, version)
+            conn.execute(sql, (start, stop))
+            conn.execute('INSERT OR REPLACE INTO schema_migration_progress VALUES (?, ?)',
+                         (version, stop))
+            conn.execute('COMMIT')
+
+            done += conn.execute(f'SELECT COUNT(*) FROM {table} WHERE rowid > ? AND rowid <= ?',
+                                 (start, stop)).fetchone()[0]
+            start = stop
+            if self.progress:
+                self.progress(version, done, total)
+            else:
+                self.logger.info(f"   v{version}: {done}/{total} rows")
+
+        self._begin(conn, version)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='CTT Bot Defender - Upgrade bots.db to the latest schema'
+    )
+    parser.add_argument(
+        '--db',
+        default='/var/lib/ctt-bot-defender/bots.db',
+        help='Detection database (default: /var/lib/ctt-bot-defender/bots.db)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=5000,
+        help='Rows per batch for data migrations (default: 5000)'
+    )
+    parser.add_argument(
+        '--status',
+        action='store_true',
+        help='Show the current version and pending migrations, then exit'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    def report(version, done, total):
+        percent = 100 * done / total if total else 100
+        print(f"   v{version}: {done}/{total} rows ({percent:.1f}%)", flush=True)
+
+    runner = MigrationRunner(args.db, args.batch_size, progress=report)
+    if args.status:
+        print(f"🗄️  {args.db}: schema v{runner.current_version()} "
+              f"(latest v{MIGRATIONS[-1][0]})")
+        for version, description, _ in runner.pending():
+            print(f"   pending v{version}: {description}")
+        return 0
+
+    version = runner.run()
+    print(f"✅ {args.db} is at schema v{version}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,7 +33,10 @@ class DefenseActions:
         if ip in self.warned_ips:
             return False
         
-        self.logger.warning(f"📧 ISSUING LEGAL WARNING to {ip}")
+        self.logger.warning(
+            f"📧 ISSUING LEGAL WARNING to {ip}",
+            extra={'ip': ip, 'rule': 'warning:issued'}
+        )
         
         warning_msg = f"""
 =================================================================
@@ -78,7 +81,10 @@ Copyright (c) 2025 A.N.F. Simões
         self._warn_via_mesh(ip, bot_info)
         
         self.warned_ips.add(ip)
-        self.logger.info(f"✅ Warning delivered to {ip} via 4 channels")
+        self.logger.info(
+            f"✅ Warning delivered to {ip} via 4 channels",
+            extra={'ip': ip, 'rule': 'warning:delivered'}
+        )
         
         return True
     
@@ -154,7 +160,10 @@ Copyright (c) 2025 A.N.F. Simões
         if threat_level not in ['HIGH', 'CRITICAL']:
             return {'success': False, 'reason': 'Threat level too low'}
         
-        self.logger.critical(f"🔥 LAUNCHING COUNTER-ATTACK on {ip}")
+        self.logger.critical(
+            f"🔥 LAUNCHING COUNTER-ATTACK on {ip}",
+            extra={'ip': ip, 'rule': 'counter_attack:launch'}
+        )
         
         # Check if tempest-sql is available
         tempest_available = self._check_tempest_available()
@@ -193,9 +202,18 @@ Copyright (c) 2025 A.N.F. Simões
         
         cmd = f"tempest-sql --target http://{ip} {attack_type}"
         
-        self.logger.critical(f"💥💥💥 AUTONOMOUS TEMPEST-SQL COUNTER-ATTACK")
-        self.logger.critical(f"🎯 Target: {ip}")
-        self.logger.critical(f"⚡ Payload: {description}")
+        self.logger.critical(
+            f"💥💥💥 AUTONOMOUS TEMPEST-SQL COUNTER-ATTACK",
+            extra={'ip': ip, 'rule': 'tempest_sql:start'}
+        )
+        self.logger.critical(
+            f"🎯 Target: {ip}",
+            extra={'ip': ip, 'rule': 'tempest_sql:target'}
+        )
+        self.logger.critical(
+            f"⚡ Payload: {description}",
+            extra={'ip': ip, 'rule': 'tempest_sql:payload'}
+        )
         
         try:
             result = subprocess.run(
@@ -206,8 +224,14 @@ Copyright (c) 2025 A.N.F. Simões
             )
             
             if result.returncode == 0:
-                self.logger.critical(f"✅✅✅ TEMPEST-SQL ATTACK SUCCESSFUL on {ip}")
-                self.logger.critical(f"🔥 {description} DEPLOYED")
+                self.logger.critical(
+                    f"✅✅✅ TEMPEST-SQL ATTACK SUCCESSFUL on {ip}",
+                    extra={'ip': ip, 'rule': 'tempest_sql:success'}
+                )
+                self.logger.critical(
+                    f"🔥 {description} DEPLOYED",
+                    extra={'ip': ip, 'rule': 'tempest_sql:deployed'}
+                )
                 return {
                     'success': True,
                     'method': 'tempest_sql_autonomous',
@@ -215,7 +239,10 @@ Copyright (c) 2025 A.N.F. Simões
                     'payload': description
                 }
             else:
-                self.logger.warning(f"⚠️  TEMPEST-SQL failed: {result.stderr.decode()[:200]}")
+                self.logger.warning(
+                    f"⚠️  TEMPEST-SQL failed: {result.stderr.decode()[:200]}",
+                    extra={'ip': ip, 'rule': 'tempest_sql:failed'}
+                )
                 return {
                     'success': False,
                     'method': 'tempest_sql_failed',
@@ -236,7 +263,10 @@ Copyright (c) 2025 A.N.F. Simões
                 f.write(f"{timestamp} | {ip} | {bot_info.get('bot_id', 'N/A')} | "
                        f"Threat: {bot_info.get('threat_level', 'N/A')}\n")
             
-            self.logger.warning(f"⚡ Target logged for manual TEMPEST attack: {ip}")
+            self.logger.warning(
+                f"⚡ Target logged for manual TEMPEST attack: {ip}",
+                extra={'ip': ip, 'rule': 'counter_attack:logged'}
+            )
             return {
                 'success': True,
                 'method': 'logged_for_manual',
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+CTT Detection Aggregator - Fleet-Wide Detection Merging
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+from collections import OrderedDict
+import socketserver
+import socket
+import threading
+import os
+import random
+import json
+import time
+import sys
+import argparse
+import logging
+
+MAX_LINE = 4 * 1024 * 1024  # largest accepted protocol line (bytes)
+
+
+def parse_address(address):
+    """'host:port' -> TCP (host, port); anything containing '/' -> unix socket path"""
+    if '/' in address:
+        return socket.AF_UNIX, address
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+class _AggregatorHandler(socketserver.StreamRequestHandler):
+    """
+    Newline-delimited JSON protocol, one request and one reply per line:
+    - {"op": "push", "node": id, "session": token, "seq": n,
+       "detections": [[ip, score, count, last_seen, rules], ...]}
+      (a batch whose seq is not above the last one from that node's session is a replay)
+    - {"op": "pull", "node": id, "since": epoch}
+      -> {"ok": true, "now": epoch, "reputation": {ip: [score, count, nodes, last_seen]}}
+      (nodes counts nodes other than the requesting one)
+    """
+
+    def setup(self):
+        super().setup()
+        with self.server.aggregator.lock:
+            self.server.aggregator.connections.add(self.request)
+
+    def finish(self):
+        with self.server.aggregator.lock:
+            self.server.aggregator.connections.discard(self.request)
+        super().finish()
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_LINE)
+            if not line:
+                return
+            if not line.endswith(b'\n'):
+                self._reply({'ok': False, 'error': 'line too long'})
+                return
+            try:
+                request = json.loads(line)
+                reply = self.server.aggregator.handle_request(request)
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            self._reply(reply)
+
+    def _reply(self, reply):
+        self.wfile.write(json.dumps(reply, separators=(',', ':')).encode() + b'\n')
+        self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class DetectionAggregator:
+    """Merge batched detection summaries from many defender nodes"""
+
+    def __init__(self, listen='127.0.0.1:9877', max_ips=500000):
+        self.logger = logging.getLogger('DetectionAggregator')
+        self.listen = listen
+        self.max_ips = max_ips
+        self.lock = threading.Lock()
+        # ip -> {'score', 'count', 'nodes', 'last_seen', 'updated', 'rules'}
+        self.reputation = OrderedDict()
+        self.sequences = {}     # node -> (session, last merged seq)
+        self.connections = set()
+        self.batches = 0
+        self.replays = 0
+        self.server = None
+
+    def handle_request(self, request):
+        """Apply one protocol request and return its reply"""
+        op = request.get('op')
+        if op == 'push':
+            accepted = self.merge(request.get('node', 'unknown'), request.get('detections', []),
+                                  request.get('session'), request.get('seq'))
+            return {'ok': True, 'accepted': accepted}
+        if op == 'pull':
+            now, reputation = self.pull(request.get('since', 0), request.get('node'))
+            return {'ok': True, 'now': now, 'reputation': reputation}
+        return {'ok': False, 'error': f'unknown op: {op}'}
+
+    def merge(self, node, detections, session=None, seq=None):
+        """
+        Merge one node's batch; returns number of entries merged (0 for a replay)
+
+        The whole batch is validated before anything is applied, so a
+        malformed entry rejects it without a partial merge or a recorded seq.
+        """
+        detections = [self._validate(detection) for detection in detections]
+        with self.lock:
+            if seq is not None:
+                # A client retries a batch whose reply it never saw: merge it once
+                last = self.sequences.get(node)
+                if last and last[0] == session and seq <= last[1]:
+                    self.replays += 1
+                    return 0
+                self.sequences[node] = (session, seq)
+
+            # Stamped under the lock so pull()'s 'now' orders against every merge
+            now = time.time()
+            for ip, score, count, last_seen, rules in detections:
+                entry = self.reputation.get(ip)
+                if entry is None:
+                    entry = {'score': 0, 'count': 0, 'nodes': set(),
+                             'last_seen': 0, 'updated': now, 'rules': set()}
+                    self.reputation[ip] = entry
+                    if len(self.reputation) > self.max_ips:
+                        self.reputation.popitem(last=False)
+                else:
+                    self.reputation.move_to_end(ip)
+                entry['score'] = max(entry['score'], score)
+                entry['count'] += count
+                entry['nodes'].add(node)
+                entry['last_seen'] = max(entry['last_seen'], last_seen)
+                entry['updated'] = now
+                entry['rules'].update(rules)
+            self.batches += 1
+        return len(detections)
+
+    @staticmethod
+    def _validate(detection):
+        """Return a pushed [ip, score, count, last_seen, rules] entry with checked types"""
+        ip, score, count, last_seen, rules = detection
+        if not isinstance(ip, str) or not isinstance(rules, list):
+            raise ValueError(f'malformed detection: {detection!r}')
+        return ip, int(score), int(count), float(last_seen), [str(rule) for rule in rules]
+
+    def snapshot(self, since=0, node=None):
+        """Compact merged view of IPs updated since, node counts excluding node"""
+        return self.pull(since, node)[1]
+
+    def pull(self, since=0, node=None):
+        """
+        Return (now, view) taken in one critical section
+
+        A client that pulls again with since=now sees every later merge;
+        entries stamped exactly at now are sent twice, which is harmless.
+        """
+        with self.lock:
+            now = time.time()
+            return now, {
+                ip: [entry['score'], entry['count'],
+                     len(entry['nodes']) - (node in entry['nodes']), entry['last_seen']]
+                for ip, entry in self.reputation.items()
+                if entry['updated'] >= since
+            }
+
+    def start(self):
+        """Start serving in a background thread; returns the bound address"""
+        family, address = parse_address(self.listen)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)  # stale socket from a previous run
+        server_class = _UnixServer if family == socket.AF_UNIX else _TCPServer
+        self.server = server_class(address, _AggregatorHandler)
+        self.server.aggregator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.logger.info(f"🌐 Aggregator listening on {self.server.server_address}")
+        return self.server.server_address
+
+    def stop(self):
+        """Stop listening and drop connected clients (they reconnect on restart)"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            with self.lock:
+                connections = list(self.connections)
+            for connection in connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.server = None
+
+
+class AggregatorClient:
+    """
+    Stream a defender's detections to the aggregator and pull back the fleet view
+
+    Detections are summarised per IP between flushes and held in a buffer
+    bounded by max_buffer IPs (new IPs are dropped and counted when full).
+    A batch whose push fails is kept as is and retried, with exponential
+    backoff, under the same sequence number, so the aggregator merges it
+    once even if only the reply was lost. The pulled fleet view is an LRU
+    of at most max_reputation IPs.
+    """
+
+    def __init__(self, address, node_id, max_buffer=10000, flush_interval=5,
+                 max_backoff=300, timeout=10, max_reputation=100000):
+        self.logger = logging.getLogger('AggregatorClient')
+        self.address = address
+        self.node_id = node_id
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.max_reputation = max_reputation
+
+        self.lock = threading.Lock()
+        self._flush_lock = threading.Lock()     # one flush at a time owns the connection
+        self._pending = {}          # ip -> [score, count, last_seen, rules]
+        self._inflight = None       # (seq, detections) pushed but not yet acknowledged
+        self.session = os.urandom(8).hex()
+        self._seq = 0
+        self._sock = None
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.failures = 0
+
+        self.reputation = OrderedDict()     # ip -> [score, count, other nodes, last_seen]
+        self._last_pull = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def record(self, ip, score, count=1, rules=(), last_seen=None):
+        """Add one detection to the next batch"""
+        last_seen = last_seen or time.time()
+        with self.lock:
+            entry = self._pending.get(ip)
+            if entry is None:
+                if len(self._pending) >= self.max_buffer:
+                    self.dropped += count
+                    return False
+                self._pending[ip] = [score, count, last_seen, set(rules)]
+            else:
+                entry[0] = max(entry[0], score)
+                entry[1] += count
+                entry[2] = max(entry[2], last_seen)
+                entry[3].update(rules)
+        return True
+
+    def fleet_nodes(self, ip):
+        """Number of other nodes that reported ip, per the last pulled fleet view"""
+        with self.lock:
+            entry = self.reputation.get(ip)
+        return entry[2] if entry else 0
+
+    def fleet_statistics(self):
+        """IPs in the fleet view, and how many of them other nodes reported"""
+        with self.lock:
+            return {
+                'known': len(self.reputation),
+                'shared': sum(1 for entry in self.reputation.values() if entry[2])
+            }
+
+    def _connect(self):
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        self._sock = sock
+        self._file = sock.makefile('rwb')
+
+    def _close(self):
+        for closable in (self._file, self._sock):
+            try:
+                if closable:
+                    closable.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    def _request(self, request):
+        if self._sock is None:
+            self._connect()
+        self._file.write(json.dumps(request, separators=(',', ':')).encode() + b'\n')
+        self._file.flush()
+        line = self._file.readline(MAX_LINE)
+        if not line:
+            raise ConnectionError('aggregator closed the connection')
+        reply = json.loads(line)
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error', 'request failed'))
+        return reply
+
+    def flush(self):
+        """Push pending detections and pull fleet updates; returns True on success"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        # A batch held from a failed push goes first, then what piled up behind it
+        for _ in range(2):
+            if self._inflight is None:
+                with self.lock:
+                    batch, self._pending = self._pending, {}
+                if not batch:
+                    break
+                self._seq += 1
+                self._inflight = (self._seq, [[ip, e[0], e[1], e[2], sorted(e[3])]
+                                              for ip, e in batch.items()])
+
+            seq, detections = self._inflight
+            try:
+                self._request({'op': 'push', 'node': self.node_id, 'session': self.session,
+                               'seq': seq, 'detections': detections})
+            except RuntimeError as e:
+                # The aggregator answered and refused it: retrying won't help
+                self.dropped += sum(d[2] for d in detections)
+                self.logger.error(f"Aggregator rejected batch {seq}: {e}")
+            except Exception as e:
+                return self._failed(f"{e}; {len(detections)} IPs held for retry")
+            else:
+                self.sent += len(detections)
+            self._inflight = None
+
+        try:
+            reply = self._request({'op': 'pull', 'node': self.node_id, 'since': self._last_pull})
+        except Exception as e:
+            return self._failed(e)
+
+        with self.lock:
+            for ip, entry in reply['reputation'].items():
+                self.reputation[ip] = entry
+                self.reputation.move_to_end(ip)
+            while len(self.reputation) > self.max_reputation:
+                self.reputation.popitem(last=False)
+        self._last_pull = reply['now']
+        self.failures = 0
+        return True
+
+    def _failed(self, reason):
+        """Drop the connection and back off; returns False for flush()"""
+        self._close()
+        self.failures += 1
+        self.logger.warning(f"⚠️  Aggregator unreachable ({reason})")
+        return False
+
+    def _backoff(self):
+        """Seconds to wait before the next attempt"""
+        if not self.failures:
+            return self.flush_interval
+        delay = min(self.max_backoff, self.flush_interval * (2 ** self.failures))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _run(self):
+        while not self._stop.wait(self._backoff()):
+            self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sender after a last flush attempt"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.timeout)
+        # Waits for a flush still running on the sender thread
+        self.flush()
+        with self._flush_lock:
+            self._close()
+
+
+def simulate(nodes=5, scanners=50, events=2000, restart=False, downtime=1.0):
+    """
+    Run an aggregator and several defender nodes on localhost
+
+    Every node sees traffic from the same pool of scanner IPs plus its own
+    local IPs; the merged view must count each scanner across all nodes,
+    and no node may see its own local IPs as reported by others. With
+    restart, the aggregator goes down once every node is halfway through
+    and comes back on the same address after downtime seconds: clients
+    must reconnect and neither lose nor double-count a batch.
+    """
+    aggregator = DetectionAggregator('127.0.0.1:0')
+    host, port = aggregator.start()
+    address = aggregator.listen = f"{host}:{port}"
+
+    clients = [AggregatorClient(address, f"edge-{n}", flush_interval=0.2, max_backoff=2)
+               for n in range(nodes)]
+    expected = {}
+    lock = threading.Lock()
+    halfway = threading.Barrier(nodes + 1)
+    down = threading.Event()
+    resumed = threading.Event()
+
+    def run_node(n, client):
+        rng = random.Random(n)
+        client.start()
+        for i in range(events):
+            if restart and i == events // 2:
+                halfway.wait()
+                down.wait()
+            if rng.random() < 0.5:
+                ip = f"203.0.113.{rng.randrange(scanners)}"
+            else:
+                ip = f"10.{n}.{i % 200}.1"
+            client.record(ip, rng.choice([30, 60, 80]), rules=['port_scan'])
+            with lock:
+                expected[ip] = expected.get(ip, 0) + 1
+        if restart:
+            resumed.wait()
+        client.stop()
+
+    started = time.time()
+    threads = [threading.Thread(target=run_node, args=(n, c)) for n, c in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    failed_flushes = 0
+    if restart:
+        halfway.wait()
+        aggregator.stop()
+        down.set()
+        time.sleep(downtime)
+        failed_flushes = sum(client.failures for client in clients)
+        aggregator.start()
+        resumed.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    view = aggregator.snapshot()
+    mismatches = [ip for ip, count in expected.items() if view.get(ip, [0, 0])[1] != count]
+    fleet_wide = [ip for ip, entry in view.items() if entry[2] == nodes]
+    self_flagged = [ip for n, client in enumerate(clients)
+                    for ip in client.reputation
+                    if ip.startswith(f"10.{n}.") and client.fleet_nodes(ip)]
+    aggregator.stop()
+
+    print(f"🌐 {nodes} nodes, {nodes * events} detections in {elapsed:.2f}s "
+          f"({aggregator.batches} batches, {aggregator.replays} replays dropped)")
+    if restart:
+        print(f"   Aggregator restarted mid-stream: {failed_flushes} failed flushes "
+              f"during {downtime:.1f}s downtime")
+    print(f"   Merged IPs: {len(view)} - seen on every node: {len(fleet_wide)}")
+    print(f"   Count mismatches: {len(mismatches)}")
+    print(f"   Local IPs flagged as fleet-reported: {len(self_flagged)}")
+    return 0 if not mismatches and not self_flagged else 1
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='CTT Bot Defender - Fleet detection aggregator'
+    )
+    parser.add_argument('command', choices=['serve', 'simulate'])
+    parser.add_argument(
+        '--listen',
+        default='127.0.0.1:9877',
+        help='host:port or unix socket path to listen on (default: 127.0.0.1:9877)'
+    )
+    parser.add_argument('--nodes', type=int, default=5, help='simulate: defender nodes')
+    parser.add_argument('--events', type=int, default=2000, help='simulate: detections per node')
+    parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='simulate: restart the aggregator mid-stream'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.command == 'simulate':
+        return simulate(nodes=args.nodes, events=args.events, restart=args.restart)
+
+    aggregator = DetectionAggregator(args.listen)
+    aggregator.start()
+    try:
+        while True:
+            time.sleep(60)
+            aggregator.logger.info(
+                f"📊 {len(aggregator.reputation)} IPs merged from {aggregator.batches} batches"
+            )
+    except KeyboardInterrupt:
+        aggregator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
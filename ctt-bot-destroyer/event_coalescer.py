@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+CTT Event Coalescer - Per-Cycle Duplicate Collapsing
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+from datetime import datetime
+import logging
+
+class EventCoalescer:
+    """Collapse identical events seen within one scan cycle"""
+
+    KEY_FIELDS = ('ip', 'user_agent', 'endpoint', 'method')
+
+    def __init__(self):
+        self.logger = logging.getLogger('EventCoalescer')
+        self._events = {}
+        self.total_in = 0
+
+    def add(self, event, timestamp=None):
+        """
+        Add one event dict (ip, user_agent, endpoint, method, payload)
+
+        Duplicates of an already buffered (ip, user_agent, endpoint, method)
+        tuple only bump its count and last_seen.
+        """
+        now = timestamp or datetime.now().isoformat()
+        key = tuple(event.get(field, '') for field in self.KEY_FIELDS)
+        count = event.get('count', 1)
+        self.total_in += count
+
+        existing = self._events.get(key)
+        if existing:
+            existing['count'] += count
+            existing['last_seen'] = event.get('last_seen', now)
+            # Keep the first non-empty payload for SQLi inspection
+            if not existing['payload'] and event.get('payload'):
+                existing['payload'] = event['payload']
+            return existing
+
+        coalesced = {
+            'ip': key[0],
+            'user_agent': key[1],
+            'endpoint': key[2],
+            'method': key[3],
+            'payload': event.get('payload', ''),
+            'count': count,
+            'first_seen': event.get('first_seen', now),
+            'last_seen': event.get('last_seen', now)
+        }
+        self._events[key] = coalesced
+        return coalesced
+
+    def extend(self, events):
+        """Add several events"""
+        for event in events:
+            self.add(event)
+
+    def drain(self):
+        """
+        Return coalesced events (in first-seen order) and reset the buffer
+
+        Each event carries count, first_seen and last_seen.
+        """
+        events = list(self._events.values())
+        if self.total_in > len(events):
+            self.logger.debug(
+                f"Coalesced {self.total_in} events into {len(events)}"
+            )
+        self._events = {}
+        self.total_in = 0
+        return events
+
+    def __len__(self):
+        return len(self._events)
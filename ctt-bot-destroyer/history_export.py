@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+CTT History Export - Columnar Detection History and Analytics
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import sqlite3
+import json
+import os
+import sys
+import argparse
+from datetime import datetime
+import logging
+
+import numpy as np
+
+# Per-attack columns: name -> dtype (dictionary-encoded columns hold int32 codes)
+ATTACK_COLUMNS = {
+    'id': np.int64,
+    'ts': np.int64,
+    'last_ts': np.int64,
+    'count': np.int32,
+    'bot_score': np.int16,
+    'ip': np.int32,
+    'user_agent': np.int32,
+    'endpoint': np.int32,
+    'method': np.int32,
+    'detections': np.int32
+}
+
+BOT_COLUMNS = {
+    'first_ts': np.int64,
+    'last_ts': np.int64,
+    'bot_score': np.int16,
+    'attack_count': np.int64,
+    'ip': np.int32,
+    'user_agent': np.int32,
+    'detections': np.int32
+}
+
+DICTIONARY_COLUMNS = ('ip', 'user_agent', 'endpoint', 'method', 'detections')
+
+
+def _to_epoch(timestamp):
+    """Convert a stored ISO timestamp to epoch seconds (0 if unparseable)"""
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def _write_json(path, data):
+    """Atomically replace a JSON file"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class HistoryExporter:
+    """
+    Export attacks and detected_bots into memory-mappable column chunks
+
+    Layout of out_dir:
+    - manifest.json: exported chunks, their time ranges and the last attack id
+    - dictionaries.json: append-only value lists for the encoded columns
+    - attacks_NNNNNN/<column>.npy: one array per column, one dir per chunk
+    - bots/<column>.npy: snapshot of detected_bots, replaced on every export
+
+    Exports are incremental: only attacks with an id above the last
+    exported one are read, in keyset-paginated batches. dictionaries.json
+    and manifest.json are written once, in that order, at the end of an
+    export; chunks left by an interrupted run are unreferenced and get
+    overwritten by the next one.
+    """
+
+    def __init__(self, db_path='/var/lib/ctt-bot-defender/bots.db',
+                 out_dir='/var/lib/ctt-bot-defender/history', chunk_rows=100000):
+        self.logger = logging.getLogger('HistoryExporter')
+        self.db_path = db_path
+        self.out_dir = out_dir
+        self.chunk_rows = chunk_rows
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.manifest = self._load('manifest.json', {'last_id': 0, 'chunks': []})
+        dictionaries = self._load('dictionaries.json', {})
+        self.dictionaries = {
+            column: dictionaries.get(column, []) for column in DICTIONARY_COLUMNS
+        }
+        self._codes = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in self.dictionaries.items()
+        }
+
+    def _load(self, name, default):
+        path = os.path.join(self.out_dir, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return default
+
+    def _encode(self, column, value):
+        """Return the dictionary code for value, adding it if new"""
+        value = value or ''
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+            codes[value] = code
+        return code
+
+    def _write_columns(self, chunk_dir, columns, dtypes):
+        os.makedirs(chunk_dir, exist_ok=True)
+        for name, dtype in dtypes.items():
+            np.save(os.path.join(chunk_dir, f"{name}.npy"),
+                    np.asarray(columns[name], dtype=dtype))
+
+    def export(self):
+        """
+        Export new attacks and a fresh detected_bots snapshot
+
+        Returns number of attack rows exported.
+        """
+        # Read-only connection so the exporter never blocks defender writes
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        c = conn.cursor()
+        exported = 0
+
+        # Attacks recorded before schema v4 carry no verdict of their own
+        attack_columns = [row[1] for row in c.execute('PRAGMA table_info(attacks)')]
+        verdict = ('COALESCE(a.bot_score, b.bot_score, 0), b.ip_address, b.user_agent, '
+                   'a.endpoint, a.method, COALESCE(a.detections, b.detections)'
+                   if 'detections' in attack_columns else
+                   'COALESCE(b.bot_score, 0), b.ip_address, b.user_agent, '
+                   'a.endpoint, a.method, b.detections')
+
+        while True:
+            c.execute(f'''
+                SELECT a.id, a.timestamp, a.last_timestamp, COALESCE(a.count, 1),
+                       {verdict}
+                FROM attacks a LEFT JOIN detected_bots b ON a.bot_id = b.bot_id
+                WHERE a.id > ?
+                ORDER BY a.id
+                LIMIT ?
+            ''', (self.manifest['last_id'], self.chunk_rows))
+            rows = c.fetchall()
+            if not rows:
+                break
+
+            columns = {name: [] for name in ATTACK_COLUMNS}
+            for (attack_id, ts, last_ts, count, score, ip, user_agent,
+                 endpoint, method, detections) in rows:
+                columns['id'].append(attack_id)
+                columns['ts'].append(_to_epoch(ts))
+                columns['last_ts'].append(_to_epoch(last_ts or ts))
+                columns['count'].append(count)
+                columns['bot_score'].append(score)
+                columns['ip'].append(self._encode('ip', ip))
+                columns['user_agent'].append(self._encode('user_agent', user_agent))
+                columns['endpoint'].append(self._encode('endpoint', endpoint))
+                columns['method'].append(self._encode('method', method))
+                columns['detections'].append(self._encode('detections', detections))
+
+            name = f"attacks_{len(self.manifest['chunks']) + 1:06d}"
+            self._write_columns(os.path.join(self.out_dir, name), columns, ATTACK_COLUMNS)
+
+            # Unparseable timestamps are stored as 0 and skipped by the reports
+            valid = [ts for ts in columns['ts'] if ts] or [0]
+            self.manifest['chunks'].append({
+                'name': name,
+                'rows': len(rows),
+                'ts_min': min(valid),
+                'ts_max': max(valid)
+            })
+            self.manifest['last_id'] = columns['id'][-1]
+
+            exported += len(rows)
+            self.logger.info(f"Exported {name}: {len(rows)} attacks")
+
+        self._export_bots(c)
+        conn.close()
+
+        # Dictionaries first: a manifest must never reference unknown codes
+        _write_json(os.path.join(self.out_dir, 'dictionaries.json'), self.dictionaries)
+        _write_json(os.path.join(self.out_dir, 'manifest.json'), self.manifest)
+        return exported
+
+    def _export_bots(self, c):
+        """Replace the detected_bots snapshot"""
+        columns = {name: [] for name in BOT_COLUMNS}
+        c.execute('''
+            SELECT first_seen, last_seen, bot_score, attack_count,
+                   ip_address, user_agent, detections
+            FROM detected_bots
+        ''')
+        for first_seen, last_seen, score, attack_count, ip, user_agent, detections in c:
+            columns['first_ts'].append(_to_epoch(first_seen))
+            columns['last_ts'].append(_to_epoch(last_seen))
+            columns['bot_score'].append(score or 0)
+            columns['attack_count'].append(attack_count or 0)
+            columns['ip'].append(self._encode('ip', ip))
+            columns['user_agent'].append(self._encode('user_agent', user_agent))
+            columns['detections'].append(self._encode('detections', detections))
+
+        self._write_columns(os.path.join(self.out_dir, 'bots'), columns, BOT_COLUMNS)
+
+
+class HistoryAnalytics:
+    """Vectorized reports over exported history (never touches bots.db)"""
+
+    def __init__(self, history_dir='/var/lib/ctt-bot-defender/history'):
+        self.history_dir = history_dir
+        with open(os.path.join(history_dir, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(history_dir, 'dictionaries.json')) as f:
+            self.dictionaries = json.load(f)
+
+    def columns(self, names, start=None, end=None):
+        """
+        Yield (ts, [columns...]) per chunk for rows with start <= ts < end
+
+        Chunks are memory-mapped and only the ones overlapping the range are
+        touched, one at a time, so memory stays bounded by the chunk size.
+        Rows whose timestamp could not be parsed (ts == 0) are skipped.
+        """
+        for chunk in self.manifest['chunks']:
+            if start is not None and chunk['ts_max'] < start:
+                continue
+            if end is not None and chunk['ts_min'] >= end:
+                continue
+            path = os.path.join(self.history_dir, chunk['name'])
+            ts = np.load(os.path.join(path, 'ts.npy'), mmap_mode='r')
+            mask = ts > 0
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts < end
+            if not mask.any():
+                continue
+            yield ts[mask], [
+                np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')[mask]
+                for name in names
+            ]
+
+    def _codes_matching(self, column, predicate):
+        return np.array([code for code, value in enumerate(self.dictionaries[column])
+                         if predicate(value)], dtype=np.int32)
+
+    @staticmethod
+    def _bucketed(pieces, bucket, start=None):
+        """
+        Sum (ts, weights) pieces into fixed-width time buckets
+
+        Buckets are aligned to start, or to the epoch without one.
+        Returns (bucket_start_epochs, counts).
+        """
+        base = start or 0
+        first = 0 if start is not None else None    # bucket index of counts[0]
+        counts = np.zeros(0, dtype=np.int64)
+        for ts, weights in pieces:
+            index = (ts - base) // bucket
+            low = int(index.min())
+            piece = np.bincount(index - low, weights=weights).astype(np.int64)
+            if first is None:
+                first = low
+            new_first = min(first, low)
+            merged = np.zeros(max(first + len(counts), low + len(piece)) - new_first,
+                              dtype=np.int64)
+            merged[first - new_first:first - new_first + len(counts)] += counts
+            merged[low - new_first:low - new_first + len(piece)] += piece
+            counts, first = merged, new_first
+        if first is None:
+            return np.array([], dtype=np.int64), counts
+        return base + (first + np.arange(len(counts), dtype=np.int64)) * bucket, counts
+
+    def histogram(self, bucket=3600, start=None, end=None):
+        """
+        Attack counts (weighted by multiplicity) per time bucket
+
+        Returns (bucket_start_epochs, counts).
+        """
+        return self._bucketed(
+            ((ts, count) for ts, (count,) in self.columns(['count'], start, end)),
+            bucket, start
+        )
+
+    def hourly_histogram(self, start=None, end=None):
+        """Attack counts per hour"""
+        return self.histogram(3600, start, end)
+
+    def rule_trend(self, rule, bucket=86400, start=None, end=None):
+        """
+        Attack counts per time bucket for attacks flagged by rule
+
+        rule matches a detection name or its prefix, e.g. 'honeypot' or
+        'honeypot:/admin'. Returns (bucket_start_epochs, counts).
+        """
+        codes = self._codes_matching(
+            'detections',
+            lambda value: any(d == rule or d.startswith(f"{rule}:") for d in value.split(','))
+        )
+
+        def pieces():
+            for ts, (count, detections) in self.columns(['count', 'detections'], start, end):
+                mask = np.isin(detections, codes)
+                if mask.any():
+                    yield ts[mask], count[mask]
+
+        return self._bucketed(pieces(), bucket, start)
+
+    def _totals(self, column, start=None, end=None):
+        """Per-code totals of an encoded column, weighted by multiplicity"""
+        totals = np.zeros(len(self.dictionaries[column]), dtype=np.int64)
+        for ts, (count, codes) in self.columns(['count', column], start, end):
+            totals += np.bincount(codes, weights=count,
+                                  minlength=len(totals)).astype(np.int64)
+        return totals
+
+    def rule_totals(self, start=None, end=None):
+        """Total attacks per detection rule"""
+        per_code = self._totals('detections', start, end)
+        totals = {}
+        for code in np.flatnonzero(per_code):
+            for rule in self.dictionaries['detections'][code].split(','):
+                if rule:
+                    totals[rule] = totals.get(rule, 0) + int(per_code[code])
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def top(self, column='ip', n=10, start=None, end=None):
+        """Most frequent values of an encoded column, weighted by multiplicity"""
+        per_code = self._totals(column, start, end)
+        order = np.argsort(per_code)[::-1][:n]
+        return [(self.dictionaries[column][code], int(per_code[code]))
+                for code in order if per_code[code] > 0]
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='CTT Bot Defender - Columnar detection history export and reports'
+    )
+    parser.add_argument('command', choices=['export', 'report'])
+    parser.add_argument(
+        '--db',
+        default='/var/lib/ctt-bot-defender/bots.db',
+        help='Detection database (default: /var/lib/ctt-bot-defender/bots.db)'
+    )
+    parser.add_argument(
+        '--out',
+        default='/var/lib/ctt-bot-defender/history',
+        help='History directory (default: /var/lib/ctt-bot-defender/history)'
+    )
+    parser.add_argument(
+        '--days',
+        type=int,
+        default=28,
+        help='Report window in days (default: 28)'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.command == 'export':
+        exported = HistoryExporter(args.db, args.out).export()
+        print(f"📦 Exported {exported} new attacks to {args.out}")
+        return 0
+
+    analytics = HistoryAnalytics(args.out)
+    end = int(datetime.now().timestamp())
+    # Align to the hour so the hourly buckets start on the hour
+    start = (end - args.days * 86400) // 3600 * 3600
+
+    hours, counts = analytics.hourly_histogram(start, end)
+    print(f"📊 ATTACK HISTORY - last {args.days} days")
+    print(f"   Total attacks: {int(counts.sum())}")
+    if len(counts):
+        peak = int(np.argmax(counts))
+        print(f"   Peak hour: {datetime.fromtimestamp(int(hours[peak])).isoformat()} "
+              f"({int(counts[peak])} attacks)")
+    print("   Top IPs:")
+    for ip, count in analytics.top('ip', 10, start, end):
+        print(f"     {ip}: {count}")
+    print("   Detections:")
+    for rule, count in analytics.rule_totals(start, end).items():
+        print(f"     {rule}: {count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+CTT Ingest Queue - Bounded Event Queue with Priority-Aware Load Shedding
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+from collections import deque, OrderedDict
+import logging
+import random
+import threading
+import time
+
+class IngestQueue:
+    """
+    Bounded queue between the event sources and the detector
+
+    Events from IPs not seen before and events flagged by is_priority
+    (e.g. honeypot hits) go to the priority lane. When the queue is full
+    a priority event evicts the oldest repeat event; repeat events are
+    only admitted for a sample_rate fraction, replacing the oldest repeat.
+    Everything else is shed and counted.
+    """
+
+    def __init__(self, maxsize=10000, sample_rate=0.1, is_priority=None,
+                 known_ip_limit=100000):
+        self.logger = logging.getLogger('IngestQueue')
+        self.maxsize = maxsize
+        self.sample_rate = sample_rate
+        self.is_priority = is_priority
+        self.known_ip_limit = known_ip_limit
+
+        # Sources may push from other threads (e.g. the ingest socket)
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self._priority = deque()
+        self._repeat = deque()
+        self._known_ips = OrderedDict()
+
+        # Counters are in events, i.e. they include coalesced multiplicity
+        self.accepted = 0
+        self.shed_priority = 0
+        self.shed_repeat = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _classify(self, event):
+        """Return True if the event belongs in the priority lane"""
+        if event.get('ip') not in self._known_ips:
+            return True
+        return bool(self.is_priority and self.is_priority(event))
+
+    def _mark_known(self, ip):
+        """Remember an IP once one of its events has been accepted"""
+        if ip in self._known_ips:
+            self._known_ips.move_to_end(ip)
+        else:
+            self._known_ips[ip] = True
+            if len(self._known_ips) > self.known_ip_limit:
+                self._known_ips.popitem(last=False)
+
+    def put(self, event):
+        """
+        Offer an event to the queue
+
+        Returns True if the event was queued, False if it was shed.
+        """
+        with self.lock:
+            return self._put(event)
+
+    def _put(self, event):
+        count = event.get('count', 1)
+        priority = self._classify(event)
+        item = (time.monotonic(), event)
+
+        if len(self) >= self.maxsize:
+            if priority:
+                if not self._repeat:
+                    self.shed_priority += count
+                    return False
+                _, evicted = self._repeat.popleft()
+                self.shed_repeat += evicted.get('count', 1)
+            else:
+                if not self._repeat or random.random() >= self.sample_rate:
+                    self.shed_repeat += count
+                    return False
+                _, evicted = self._repeat.popleft()
+                self.shed_repeat += evicted.get('count', 1)
+
+        if priority:
+            self._priority.append(item)
+        else:
+            self._repeat.append(item)
+        # Only now: an unseen IP whose first event was shed stays unseen
+        self._mark_known(event.get('ip'))
+        self.accepted += count
+        self.not_empty.notify()
+        return True
+
+    def wait(self, timeout=None):
+        """Block until an event is queued or timeout passes; returns True if any is queued"""
+        with self.not_empty:
+            return self.not_empty.wait_for(lambda: len(self), timeout)
+
+    def get_batch(self, max_items=100):
+        """Pop up to max_items events, priority lane first"""
+        batch = []
+        now = time.monotonic()
+        with self.lock:
+            for lane in (self._priority, self._repeat):
+                while lane and len(batch) < max_items:
+                    enqueued, event = lane.popleft()
+                    self.last_lag = now - enqueued
+                    self.max_lag = max(self.max_lag, self.last_lag)
+                    batch.append(event)
+        return batch
+
+    def oldest_age(self):
+        """Seconds the oldest queued event has been waiting"""
+        now = time.monotonic()
+        with self.lock:
+            heads = [lane[0][0] for lane in (self._priority, self._repeat) if lane]
+        return now - min(heads) if heads else 0.0
+
+    def get_statistics(self):
+        """Get queue depth, shed counters and lag"""
+        return {
+            'queued': len(self),
+            'queued_priority': len(self._priority),
+            'accepted': self.accepted,
+            'shed_priority': self.shed_priority,
+            'shed_repeat': self.shed_repeat,
+            'shed_total': self.shed_priority + self.shed_repeat,
+            'oldest_age': self.oldest_age(),
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag
+        }
+
+    def __len__(self):
+        return len(self._priority) + len(self._repeat)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+CTT Ingest Server - Push-Based Request Event Ingestion
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import socketserver
+import socket
+import threading
+import ipaddress
+import json
+import os
+import shutil
+import sys
+import time
+import argparse
+import tempfile
+import logging
+from detection_aggregator import parse_address
+from event_coalescer import EventCoalescer
+from ingest_queue import IngestQueue
+from bot_detector import BotDetector
+
+MAX_LINE = 4 * 1024 * 1024  # largest accepted line (bytes)
+EVENT_FIELDS = ('user_agent', 'endpoint', 'method', 'payload')
+MAX_COUNT = 100000          # multiplicity cap per pushed (and per coalesced) event
+
+
+class _IngestHandler(socketserver.StreamRequestHandler):
+    """
+    Line protocol, no replies: each line is one JSON event object or a JSON
+    array of them (batched framing). Events need 'ip'; 'user_agent',
+    'endpoint', 'method', 'payload' and 'count' are optional.
+    """
+
+    def handle(self):
+        server = self.server.ingest
+        while True:
+            line = self.rfile.readline(MAX_LINE)
+            if not line:
+                return
+            if not line.endswith(b'\n'):
+                server.count(rejected=1)
+                return  # oversized line: drop the connection rather than resync
+            if line.strip():
+                server.handle_line(line)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class IngestServer:
+    """
+    Accept request events pushed by web servers, log shippers or middleware
+
+    Duplicate events within one line are coalesced (as the polled sources
+    are per scan cycle) before they reach the sink, so batched framing
+    hands the queue one event per distinct request with its count.
+
+    A unix socket is created with socket_mode and, if given, chowned to
+    socket_group, so web server or app workers in that group can connect.
+    """
+
+    def __init__(self, listen='/run/ctt-bot-defender/ingest.sock', sink=None,
+                 socket_group=None, socket_mode=0o660):
+        self.logger = logging.getLogger('IngestServer')
+        self.listen = listen
+        self.sink = sink            # called with each event dict
+        self.socket_group = socket_group
+        self.socket_mode = socket_mode
+        self.server = None
+        self.lock = threading.Lock()
+        self.received = 0
+        self.rejected = 0
+        self.forwarded = 0          # events passed to the sink after coalescing
+
+    def count(self, received=0, rejected=0, forwarded=0):
+        """Update counters (connections are served from several threads)"""
+        with self.lock:
+            self.received += received
+            self.rejected += rejected
+            self.forwarded += forwarded
+
+    @staticmethod
+    def normalize(event):
+        """
+        Return the detection pipeline's event dict for a pushed event
+
+        ip must be a literal IPv4/IPv6 address and is stored in canonical
+        form: it ends up in DefenseActions' shell commands, and the polled
+        sources only ever produce addresses. count is clamped to MAX_COUNT.
+        """
+        normalized = {'ip': str(ipaddress.ip_address(str(event['ip'])))}
+        for field in EVENT_FIELDS:
+            normalized[field] = str(event.get(field) or '')
+        normalized['count'] = min(MAX_COUNT, max(1, int(event.get('count', 1))))
+        return normalized
+
+    def handle_line(self, line):
+        """Decode one protocol line and pass its events to the sink"""
+        try:
+            decoded = json.loads(line)
+        except ValueError:
+            self.count(rejected=1)
+            return
+
+        received = rejected = 0
+        coalescer = EventCoalescer()
+        for event in decoded if isinstance(decoded, list) else [decoded]:
+            try:
+                coalescer.add(self.normalize(event))
+            except (KeyError, TypeError, ValueError, OverflowError):
+                rejected += 1
+                continue
+            received += 1
+
+        events = coalescer.drain()
+        if self.sink:
+            for event in events:
+                event['count'] = min(event['count'], MAX_COUNT)
+                self.sink(event)
+        self.count(received, rejected, len(events))
+
+    def start(self):
+        """Start serving in a background thread; returns the bound address"""
+        family, address = parse_address(self.listen)
+        if family == socket.AF_UNIX:
+            os.makedirs(os.path.dirname(address) or '.', exist_ok=True)
+            if os.path.exists(address):
+                os.unlink(address)  # stale socket from a previous run
+            self.server = _UnixServer(address, _IngestHandler)
+            if self.socket_group:
+                shutil.chown(address, group=self.socket_group)
+            os.chmod(address, self.socket_mode)
+        else:
+            self.server = _TCPServer(address, _IngestHandler)
+        self.server.ingest = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.logger.info(f"📥 Ingest socket listening on {self.server.server_address}")
+        return self.server.server_address
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def serve(address, pipeline=False, db_path=None, queue_size=10000, sample_rate=0.1,
+          batch_size=1000, socket_group=None, socket_mode=0o660):
+    """
+    Run a standalone ingest server and print per-second rates
+
+    With pipeline, events go through the defender's IngestQueue and
+    BotDetector.analyze_batch (against db_path, a scratch database by
+    default) so the rate printed is what the detector sustains, along
+    with the queue's shed counts.
+    """
+    queue = None
+    processed = [0, 0]      # events (with multiplicity), coalesced rows
+    stopping = threading.Event()
+
+    if pipeline:
+        detector = BotDetector(db_path or os.path.join(tempfile.mkdtemp(), 'bots.db'))
+        queue = IngestQueue(
+            maxsize=queue_size,
+            sample_rate=sample_rate,
+            is_priority=lambda event: detector.match_honeypot(event['endpoint']) is not None
+        )
+
+        def process():
+            while not stopping.is_set():
+                if not queue.wait(0.5):
+                    continue
+                events = queue.get_batch(batch_size)
+                detector.analyze_batch(events)
+                processed[0] += sum(event['count'] for event in events)
+                processed[1] += len(events)
+
+        threading.Thread(target=process, daemon=True).start()
+
+    server = IngestServer(address, sink=queue.put if queue is not None else None,
+                          socket_group=socket_group, socket_mode=socket_mode)
+    server.start()
+    try:
+        last_received = last_processed = 0
+        while True:
+            time.sleep(1)
+            received = server.received
+            line = f"📥 {received - last_received:,} events/sec ({server.rejected} rejected)"
+            if queue is not None:
+                stats = queue.get_statistics()
+                line += (f" - processed {processed[0] - last_processed:,} events/sec, "
+                         f"{stats['shed_total']:,} shed, {stats['queued']:,} queued, "
+                         f"lag {stats['last_lag']:.2f}s")
+                last_processed = processed[0]
+            print(line, flush=True)
+            last_received = received
+    except KeyboardInterrupt:
+        stopping.set()
+        server.stop()
+        if queue is not None:
+            print(f"📊 {server.received:,} received, {server.forwarded:,} after coalescing, "
+                  f"{processed[0]:,} processed in {processed[1]:,} rows, "
+                  f"{queue.shed_priority:,} priority / {queue.shed_repeat:,} repeat shed")
+    return 0
+
+
+def load_generator(address, connections=4, batch=500, duration=10):
+    """
+    Push synthetic request events as fast as possible
+
+    Returns events sent per second across all connections.
+    """
+    sent = [0] * connections
+    deadline = time.monotonic() + duration
+
+    def run(n):
+        family, target = parse_address(address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(target)
+        i = 0
+        while time.monotonic() < deadline:
+            events = [{
+                'ip': f"198.51.{n}.{(i + k) % 250}",
+                'user_agent': 'Mozilla/5.0' if (i + k) % 10 else 'sqlmap/1.7',
+                'endpoint': '/index.html' if (i + k) % 50 else '/.env',
+                'method': 'GET'
+            } for k in range(batch)]
+            sock.sendall(json.dumps(events, separators=(',', ':')).encode() + b'\n')
+            i += batch
+            sent[n] += batch
+        sock.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(sent) / (time.monotonic() - started)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='CTT Bot Defender - Push ingest socket and load generator'
+    )
+    parser.add_argument('command', choices=['serve', 'loadgen'])
+    parser.add_argument(
+        '--address',
+        default='/run/ctt-bot-defender/ingest.sock',
+        help='unix socket path or host:port (default: /run/ctt-bot-defender/ingest.sock)'
+    )
+    parser.add_argument('--connections', type=int, default=4, help='loadgen: parallel connections')
+    parser.add_argument('--batch', type=int, default=500, help='loadgen: events per line')
+    parser.add_argument('--duration', type=int, default=10, help='loadgen: seconds to run')
+    parser.add_argument(
+        '--group',
+        default=None,
+        help='serve: group owning the unix socket, e.g. nginx (default: unchanged)'
+    )
+    parser.add_argument(
+        '--mode',
+        type=lambda value: int(value, 8),
+        default=0o660,
+        help='serve: unix socket permissions in octal (default: 660)'
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='serve: run the ingest queue and batch detector behind the socket'
+    )
+    parser.add_argument('--db', help='serve --pipeline: detection database (default: scratch file)')
+    parser.add_argument('--queue-size', type=int, default=10000, help='serve --pipeline: queue size')
+    parser.add_argument('--batch-size', type=int, default=1000, help='serve --pipeline: batch size')
+
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.command == 'loadgen':
+        rate = load_generator(args.address, args.connections, args.batch, args.duration)
+        print(f"📤 Sent {rate:,.0f} events/sec")
+        return 0
+
+    return serve(args.address, args.pipeline, args.db, args.queue_size,
+                 batch_size=args.batch_size, socket_group=args.group, socket_mode=args.mode)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+CTT Payload Scanner - Chunked, Budgeted Request Body Inspection
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import codecs
+import re
+import time
+import logging
+
+class PayloadScanner:
+    """
+    Streaming matcher for 'token.*token.*token' style signatures
+
+    Each signature is matched as an ordered sequence of literal tokens on
+    a single line, which is what the equivalent regex matches, but with
+    str.find instead of backtracking, so every chunk is scanned in linear
+    time. Partial progress and the tail of each chunk are carried over so
+    matches spanning chunk boundaries are still found.
+    """
+
+    def __init__(self, patterns, chunk_size=65536, max_bytes=1048576, time_budget=0.05):
+        self.logger = logging.getLogger('PayloadScanner')
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes        # characters for str payloads
+        self.time_budget = time_budget    # seconds per payload
+        self.patterns = [(pattern, self._tokenize(pattern)) for pattern in patterns]
+
+    @staticmethod
+    def _tokenize(pattern):
+        """Split a 'a.*b' regex into its literal tokens ('exec\\(' -> 'exec(')"""
+        return [re.sub(r'\\(.)', r'\1', token) for token in pattern.split('.*') if token]
+
+    def _chunks(self, payload):
+        """Yield lowercased text chunks of payload (str or bytes)"""
+        if isinstance(payload, (bytes, bytearray)):
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            for start in range(0, len(payload), self.chunk_size):
+                raw = payload[start:start + self.chunk_size]
+                yield len(raw), decoder.decode(raw).lower()
+        else:
+            for start in range(0, len(payload), self.chunk_size):
+                chunk = payload[start:start + self.chunk_size]
+                yield len(chunk), chunk.lower()
+
+    def scan(self, payload):
+        """
+        Scan a payload and return a dict with:
+        - matched: bool
+        - pattern: str or None (first signature that matched)
+        - bytes_scanned: int
+        - truncated: bool (budget ran out before the end of the payload)
+        - truncated_reason: 'bytes', 'time' or None
+        """
+        result = {
+            'matched': False,
+            'pattern': None,
+            'bytes_scanned': 0,
+            'truncated': False,
+            'truncated_reason': None
+        }
+        if not payload:
+            return result
+
+        started = time.perf_counter()
+        # Per signature: index of the next token to find, and carried-over text
+        states = [[0, ''] for _ in self.patterns]
+
+        for size, text in self._chunks(payload):
+            if result['bytes_scanned'] >= self.max_bytes:
+                result['truncated'] = True
+                result['truncated_reason'] = 'bytes'
+                break
+            if time.perf_counter() - started > self.time_budget:
+                result['truncated'] = True
+                result['truncated_reason'] = 'time'
+                break
+
+            result['bytes_scanned'] += size
+            for state, (pattern, tokens) in zip(states, self.patterns):
+                if self._advance(state, tokens, text):
+                    result['matched'] = True
+                    result['pattern'] = pattern
+                    return result
+
+        return result
+
+    @staticmethod
+    def _advance(state, tokens, text):
+        """
+        Feed text to one signature's state; return True once all tokens are found
+
+        Tokens are searched across the whole text, not line by line: '.*'
+        never crosses a newline, so when one sits between two matched
+        tokens the signature restarts on the later token's line. Every
+        restart moves past a newline, which keeps a chunk linear in the
+        number of tokens however many lines it has.
+        """
+        index, carry = state
+        buf = carry + text
+        pos = 0
+        while index < len(tokens):
+            found = buf.find(tokens[index], pos)
+            if found < 0:
+                if index and buf.find('\n', pos) >= 0:
+                    # Partial match can't continue past the newline: restart on the last line
+                    pos = buf.rfind('\n', pos) + 1
+                    index = 0
+                    continue
+                break
+            if index and buf.find('\n', pos, found) >= 0:
+                pos = buf.rfind('\n', pos, found) + 1
+                index = 0
+                continue
+            pos = found + len(tokens[index])
+            index += 1
+
+        if index == len(tokens):
+            return True
+
+        # Only a suffix shorter than the next token can start a boundary match
+        keep = len(tokens[index]) - 1
+        state[0] = index
+        state[1] = buf[max(pos, len(buf) - keep):] if keep else ''
+        return False
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+CTT Bot Detector - Batch vs Per-Event Scoring Tests
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bot_detector import BotDetector
+
+USER_AGENTS = [
+    'Mozilla/5.0', 'curl/8.4', 'sqlmap/1.7', 'python-requests/2.31', 'Googlebot/2.1',
+    'tcp_connection:ESTAB', 'port_scan:22', 'syn_scan:443', 'Masscan/1.3', ''
+]
+ENDPOINTS = ['/', '/index.html', '/admin', '/wp-admin/setup.php', '/.env', '/port:22', '']
+PAYLOADS = ['', 'q=1', "id=1 UNION SELECT password FROM users", "x' or 1=1 --",
+            'union\nselect', 'EXEC(xp_cmdshell)']
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    bots = conn.execute('SELECT * FROM detected_bots ORDER BY bot_id').fetchall()
+    attacks = conn.execute('SELECT * FROM attacks ORDER BY id').fetchall()
+    conn.close()
+    return bots, attacks
+
+
+class AnalyzeBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.batch = BotDetector(os.path.join(self.tmp.name, 'batch.db'))
+        self.scalar = BotDetector(os.path.join(self.tmp.name, 'scalar.db'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameAsScalar(self, events):
+        verdicts = self.batch.analyze_batch(events)
+        for i, event in enumerate(events):
+            expected = self.scalar.analyze_connection(**event)
+            self.assertEqual(BotDetector.batch_verdict(verdicts, i), expected, event)
+        self.assertEqual(_rows(self.batch.db_path), _rows(self.scalar.db_path))
+
+    def test_empty_batch(self):
+        verdicts = self.batch.analyze_batch([])
+        self.assertEqual(len(verdicts['bot_id']), 0)
+        self.assertEqual(_rows(self.batch.db_path), ([], []))
+
+    def test_missing_user_agents(self):
+        self.assertSameAsScalar([
+            {'ip': '192.0.2.1', 'endpoint': '/admin', 'first_seen': 't1', 'last_seen': 't1'},
+            {'ip': '192.0.2.2', 'user_agent': '', 'first_seen': 't2', 'last_seen': 't2'},
+            {'ip': '192.0.2.3', 'user_agent': '', 'endpoint': '/', 'method': 'GET',
+             'first_seen': 't3', 'last_seen': 't3'}
+        ])
+
+    def test_scan_user_agents(self):
+        self.assertSameAsScalar([
+            {'ip': '192.0.2.4', 'user_agent': 'port_scan:22', 'endpoint': '/port:22',
+             'method': 'SCAN', 'first_seen': 't1', 'last_seen': 't1'},
+            {'ip': '192.0.2.5', 'user_agent': 'SYN_SCAN:443', 'endpoint': '/port:443',
+             'method': 'SCAN', 'first_seen': 't2', 'last_seen': 't2'}
+        ])
+
+    def test_repeated_bot_ids(self):
+        event = {'ip': '192.0.2.6', 'user_agent': 'curl/8.4', 'endpoint': '/index.html',
+                 'method': 'GET'}
+        self.assertSameAsScalar([
+            dict(event, count=3, first_seen='t1', last_seen='t2'),
+            dict(event, endpoint='/.env', first_seen='t3', last_seen='t3'),
+            dict(event, payload="a' or 1=1", count=2, first_seen='t4', last_seen='t5')
+        ])
+
+    def test_random_batches(self):
+        rng = random.Random(2025)
+        for batch in range(5):
+            events = []
+            for i in range(300):
+                event = {
+                    'ip': f"198.51.100.{rng.randrange(20)}",
+                    'user_agent': rng.choice(USER_AGENTS),
+                    'endpoint': rng.choice(ENDPOINTS),
+                    'method': rng.choice(['GET', 'POST', 'TCP', 'SCAN']),
+                    'payload': rng.choice(PAYLOADS),
+                    'count': rng.randint(1, 5),
+                    'first_seen': f"b{batch}-{i}",
+                    'last_seen': f"b{batch}-{i}z"
+                }
+                if rng.random() < 0.1:
+                    del event['user_agent']
+                events.append(event)
+            self.assertSameAsScalar(events)
+
+
+if __name__ == '__main__':
+    unittest.main()
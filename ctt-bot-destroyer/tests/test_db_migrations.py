@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+CTT Database Migrations - Resume, Mirroring and Concurrency Tests
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db_migrations
+from db_migrations import MigrationRunner, MigrationPending, MIGRATIONS
+
+LATEST = MIGRATIONS[-1][0]
+ROWS = 1000
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _bot(n, score=None):
+    return (f"bot{n:05d}", f"192.0.2.{n % 250}", 'curl/8', 't0', 't0',
+            score or n % 100, score or n % 100, 1, 'bot_user_agent:curl')
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, 'bots.db')
+
+        # A populated database at v2, i.e. before the batched v3 rebuild
+        with mock.patch.object(db_migrations, 'MIGRATIONS', MIGRATIONS[:2]):
+            MigrationRunner(self.db).run()
+        conn = self._conn()
+        conn.executemany('INSERT INTO detected_bots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         [_bot(n) for n in range(ROWS)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _conn(self):
+        return sqlite3.connect(self.db, timeout=30)
+
+    def _bots(self):
+        conn = self._conn()
+        rows = conn.execute('SELECT * FROM detected_bots ORDER BY bot_id').fetchall()
+        conn.close()
+        return rows
+
+    def _version(self):
+        conn = self._conn()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        conn.close()
+        return version
+
+    def assertMigrated(self, expected):
+        self.assertEqual(self._version(), LATEST)
+        self.assertEqual(self._bots(), sorted(expected))
+        conn = self._conn()
+        leftovers = conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'detected_bots_v3%'"
+        ).fetchall()
+        progress = conn.execute('SELECT * FROM schema_migration_progress').fetchall()
+        conn.close()
+        self.assertEqual(leftovers, [])
+        self.assertEqual(progress, [])
+
+    def test_resume_after_interrupted_batch(self):
+        def interrupt(version, done, total):
+            if done >= 300:
+                raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            MigrationRunner(self.db, batch_size=100, progress=interrupt).run()
+        self.assertEqual(self._version(), 2)
+        conn = self._conn()
+        self.assertEqual(conn.execute('SELECT last_key FROM schema_migration_progress '
+                                      'WHERE version = 3').fetchone(), (300,))
+        conn.close()
+
+        batches = []
+        runner = MigrationRunner(self.db, batch_size=100,
+                                 progress=lambda version, done, total: batches.append(done))
+        self.assertEqual(runner.run(), LATEST)
+        self.assertEqual(batches[0], 400)   # picked up after the recorded rowid
+        self.assertMigrated([_bot(n) for n in range(ROWS)])
+
+    def test_writes_during_copy_are_mirrored(self):
+        expected = {row[0]: row for row in (_bot(n) for n in range(ROWS))}
+        writer = self._conn()
+
+        def write(version, done, total):
+            # Between batches, like the defender would: insert, update a copied
+            # row, update a not-yet-copied row and delete one
+            n = ROWS + done
+            writer.execute('INSERT INTO detected_bots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', _bot(n))
+            expected[_bot(n)[0]] = _bot(n)
+            for key in (f"bot{done - 1:05d}", f"bot{(done + 50) % ROWS:05d}"):
+                if key not in expected:
+                    continue
+                writer.execute('UPDATE detected_bots SET attack_count = attack_count + 5 '
+                               'WHERE bot_id = ?', (key,))
+                row = list(expected[key])
+                row[7] += 5
+                expected[key] = tuple(row)
+            writer.execute('DELETE FROM detected_bots WHERE bot_id = ?', (f"bot{done // 2:05d}",))
+            expected.pop(f"bot{done // 2:05d}", None)
+            writer.commit()
+
+        MigrationRunner(self.db, batch_size=100, progress=write).run()
+        writer.close()
+        self.assertMigrated(expected.values())
+
+    def test_second_runner_finishes_first(self):
+        # The second runner (e.g. a restarting defender) completes the
+        # migration between two of the first runner's batches
+        def race(version, done, total):
+            if done == 100:
+                MigrationRunner(self.db, batch_size=100).run()
+
+        self.assertEqual(MigrationRunner(self.db, batch_size=100, progress=race).run(), LATEST)
+        self.assertMigrated([_bot(n) for n in range(ROWS)])
+
+    def test_concurrent_runners_and_writer(self):
+        errors = []
+        stop = threading.Event()
+
+        def migrate():
+            try:
+                MigrationRunner(self.db, batch_size=50,
+                                progress=lambda *args: None).run()
+            except Exception as e:
+                errors.append(e)
+
+        def write():
+            conn = self._conn()
+            n = ROWS
+            while not stop.is_set():
+                conn.execute('INSERT INTO detected_bots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             _bot(n))
+                conn.commit()
+                n += 1
+            conn.close()
+            written.append(n)
+
+        written = []
+        writer = threading.Thread(target=write)
+        writer.start()
+        runners = [threading.Thread(target=migrate) for _ in range(3)]
+        for runner in runners:
+            runner.start()
+        for runner in runners:
+            runner.join()
+        stop.set()
+        writer.join()
+
+        self.assertEqual(errors, [])
+        self.assertMigrated([_bot(n) for n in range(written[0])])
+
+    def test_large_batched_migration_is_not_run_inline(self):
+        runner = MigrationRunner(self.db, max_inline_rows=ROWS - 1)
+        with self.assertRaises(MigrationPending):
+            runner.run()
+        # Nothing left behind: no copy table, no triggers, still at v2
+        self.assertEqual(self._version(), 2)
+        conn = self._conn()
+        self.assertEqual(conn.execute("SELECT name FROM sqlite_master "
+                                      "WHERE name LIKE 'detected_bots_v3%'").fetchall(), [])
+        conn.close()
+
+        self.assertEqual(MigrationRunner(self.db, max_inline_rows=ROWS).run(), LATEST)
+        self.assertMigrated([_bot(n) for n in range(ROWS)])
+
+
+if __name__ == '__main__':
+    unittest.main()
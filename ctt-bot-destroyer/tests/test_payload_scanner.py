@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+CTT Payload Scanner - Regression Tests
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import os
+import re
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from payload_scanner import PayloadScanner
+
+PATTERNS = [
+    "union.*select", "or.*1.*=.*1", "exec\\(", "drop.*table",
+    "insert.*into", "update.*set", "delete.*from"
+]
+
+
+class PayloadScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scanner = PayloadScanner(PATTERNS)
+
+    def assertWithinBudget(self, payload):
+        started = time.perf_counter()
+        result = self.scanner.scan(payload)
+        elapsed = time.perf_counter() - started
+        self.assertFalse(result['truncated'], result)
+        self.assertFalse(result['matched'])
+        # Generous margin over time_budget for slow CI machines
+        self.assertLess(elapsed, 4 * self.scanner.time_budget)
+
+    def test_newline_only_body(self):
+        self.assertWithinBudget('\n' * (1 << 20))
+
+    def test_newline_dense_body(self):
+        self.assertWithinBudget('o\n' * 500000)
+
+    def test_tokens_on_separate_lines_do_not_match(self):
+        self.assertFalse(self.scanner.scan('union\nselect')['matched'])
+        self.assertFalse(self.scanner.scan('or 1\n= 1')['matched'])
+
+    def test_restart_on_later_line(self):
+        result = self.scanner.scan('union\nfoo union all select 1')
+        self.assertTrue(result['matched'])
+        self.assertEqual(result['pattern'], 'union.*select')
+
+    def test_match_across_chunks(self):
+        scanner = PayloadScanner(PATTERNS, chunk_size=3)
+        self.assertTrue(scanner.scan('x UNION y SELECT z')['matched'])
+        self.assertFalse(scanner.scan('x union\ny select z')['matched'])
+        self.assertTrue(scanner.scan(b'drop\nx drop table')['matched'])
+
+    def test_agrees_with_regex(self):
+        pieces = ['union', 'select', 'or', '1', '=', '\n', 'exec(', 'drop', 'table',
+                  'x', ' ', 'un', 'ion', 'into', 'set', 'from', 'delete']
+        state = 12345
+        for _ in range(2000):
+            # Small LCG keeps the corpus reproducible without seeding global state
+            words = []
+            for _ in range(state % 25):
+                state = (state * 1103515245 + 12345) % 2 ** 31
+                words.append(pieces[state % len(pieces)])
+            state = (state * 1103515245 + 12345) % 2 ** 31
+            payload = ''.join(words)
+            scanner = PayloadScanner(PATTERNS, chunk_size=1 + state % 8)
+            expected = any(re.search(p, payload, re.IGNORECASE) for p in PATTERNS)
+            self.assertEqual(scanner.scan(payload)['matched'], expected, repr(payload))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+CTT Threat Logging - Asynchronous, Rate-Limited Structured Logging
+Copyright (c) 2025 A.N.F. Simões. All Rights Reserved.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import itertools
+import queue
+import sys
+import time
+
+# Record attributes copied into JSON output when a call site passes them via extra=
+STRUCTURED_FIELDS = ('ip', 'rule', 'bot_id', 'score', 'level', 'count', 'suppressed')
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through one record per (ip, rule) per window
+
+    Records without an ip attribute always pass. Repeats inside the
+    window are dropped and counted; the next record let through for that
+    key carries 'suppressed N similar', and flush() logs summaries for keys
+    that went quiet. At most max_keys keys are tracked; past that the
+    oldest windows are evicted, pending summaries included.
+    """
+
+    def __init__(self, window=60, max_keys=50000):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self._keys = {}     # (ip, rule) -> [window_start, suppressed, logger, level]
+        self.total_suppressed = 0
+        self.evicted = 0
+
+    def filter(self, record):
+        ip = getattr(record, 'ip', None)
+        if ip is None or getattr(record, 'summary', False):
+            return True
+
+        key = (ip, getattr(record, 'rule', None))
+        now = time.monotonic()
+        state = self._keys.get(key)
+
+        if state and now - state[0] < self.window:
+            state[1] += 1
+            self.total_suppressed += 1
+            return False
+
+        if state and state[1]:
+            record.suppressed = state[1]
+            record.msg = f"{record.msg} (suppressed {state[1]} similar)"
+
+        # Re-insert so the dict stays ordered by window start
+        self._keys.pop(key, None)
+        if len(self._keys) >= self.max_keys:
+            self._prune(now)
+        self._keys[key] = [now, 0, record.name, record.levelno]
+        return True
+
+    def _prune(self, now):
+        """Drop expired keys with nothing pending, then the oldest if still full"""
+        for key in [k for k, s in self._keys.items()
+                    if now - s[0] >= self.window and not s[1]]:
+            del self._keys[key]
+
+        # A flood of distinct IPs can keep every window live: evict a tenth at once
+        excess = len(self._keys) - self.max_keys + max(1, self.max_keys // 10)
+        if excess > 0:
+            for key in list(itertools.islice(self._keys, excess)):
+                del self._keys[key]
+            self.evicted += excess
+
+    def flush(self, force=False):
+        """Log 'suppressed N similar' summaries for expired (or all) windows"""
+        now = time.monotonic()
+        for (ip, rule), state in list(self._keys.items()):
+            if state[1] and (force or now - state[0] >= self.window):
+                logging.getLogger(state[2]).log(
+                    state[3],
+                    f"suppressed {state[1]} similar: {ip} - {rule}",
+                    extra={'ip': ip, 'rule': rule, 'suppressed': state[1], 'summary': True}
+                )
+                del self._keys[(ip, rule)]
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        """
+        Merge args into the message but keep exc_info
+
+        The stock prepare() formats the traceback into msg and clears
+        exc_info, so JsonFormatter could never emit its exception field.
+        Records stay in-process, so nothing needs to be picklable.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() waits for room instead of failing on a full queue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def setup_async_logging(level=logging.INFO, window=60, queue_size=10000, stream=None):
+    """
+    Route all logging through a bounded queue to a background JSON writer
+
+    Returns (listener, rate_filter, handler); call rate_filter.flush()
+    periodically and listener.stop() on shutdown. handler.dropped counts
+    records lost to a full queue.
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = DrainingQueueListener(log_queue, output, respect_handler_level=True)
+
+    rate_filter = RateLimitFilter(window=window)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(rate_filter)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener.start()
+    return listener, rate_filter, handler